@@ -0,0 +1,2 @@
+''' Benchmarks of perf-log-analyse, run them from the top directory:
+    python3 -m benchmark.<name> '''
@@ -0,0 +1,67 @@
+''' BonnieSample.parse with the row tokenizer vs. xml.dom.minidom,
+on a generated bonnie-directIO log.'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+sys.path.insert(0, '.')
+from statBonnie import BonnieSample
+
+RUN = '''--
+Needing %(size)d MB, having 137143 MB
+Bonnie 1.4: File '/abuild/Bonnie.1959', size: 104857600, volumes: 1
+Using O_DIRECT for block based I/O
+Writing with putc()...         done:  48416 kB/s  63.5 %%CPU
+Seeker 1...Seeker 2...Seeker 3...start 'em...done...done...done...
+<TR><TD>apac2-ph026</TD><TD>%(size)d * %(count)d</TD>%(cells)s</TR>
+Mon Apr 14 16:51:46 CST 2014: bonnie-directIO success: on 1/1 after 24s
+0 fail 1 succeed 1 count 0 internal_error 0 skipped
+'''
+
+def write_log(f, runs, rnd):
+    for i in range(runs):
+        cells = ''
+        for j in range(7):
+            cells += '<TD>%d</TD><TD>%5.1f</TD>' % (rnd.randint(1000, 200000),
+                                                   rnd.uniform(1, 99))
+        f.write(RUN % {'size': 100 + i // 5, 'count': 1 << (i % 5), 'cells': cells})
+
+class DomBonnieSample(BonnieSample):
+    __slots__ = ()
+    FAST_PARSE = False
+
+def measure(filename, fast, repeat):
+    best = None
+    for i in range(repeat):
+        t = BonnieSample(filename) if fast else DomBonnieSample(filename)
+        start = time.perf_counter()
+        t.parse()
+        elapsed = time.perf_counter() - start
+        t.fd.close()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, t.get_tree()
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'bonnie parser benchmark')
+    cmdlineparser.add_argument('--runs', type = int, default = 20000)
+    cmdlineparser.add_argument('--repeat', type = int, default = 3)
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+
+    with tempfile.NamedTemporaryFile('w', suffix = '.bonnie', delete = False) as f:
+        write_log(f, ns.runs, random.Random(0))
+    try:
+        t_dom, tree_dom = measure(f.name, False, ns.repeat)
+        t_fast, tree_fast = measure(f.name, True, ns.repeat)
+    finally:
+        os.remove(f.name)
+    assert tree_dom == tree_fast
+    print('%d runs' % ns.runs)
+    print('minidom:   %8.2f ms' % (t_dom * 1000))
+    print('tokenizer: %8.2f ms' % (t_fast * 1000))
+    print('speedup:   %8.2f x' % (t_dom / t_fast))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+''' ColumnarGroup.bootstrap_diff_ratio over thousands of leaves, against
+the same percentile bootstrap done leaf by leaf (on a few leaves only,
+the time is extrapolated).'''
+
+import sys
+import time
+import random
+import argparse
+sys.path.insert(0, '.')
+from namedtree import NamedTree, ColumnarGroup
+
+def make_sample(name, leaves, rnd):
+    tree = {}
+    for i in range(leaves):
+        tree.setdefault(i // 100, {})[i % 100] = rnd.gauss(1000000, 100000)
+    return NamedTree(name, tree)
+
+def per_leaf(base, this, resamples, confidence, rng):
+    ''' one leaf: draw the samples, average them, sort the ratios '''
+    alpha = 1 - confidence
+    ratio = []
+    for r in range(resamples):
+        b = list(map(lambda i:base[rng.randrange(len(base))], range(len(base))))
+        t = list(map(lambda i:this[rng.randrange(len(this))], range(len(this))))
+        mean_b = sum(b) / len(b)
+        ratio.append((sum(t) / len(t) - mean_b) / mean_b)
+    ratio.sort()
+    return ratio[int(alpha / 2 * resamples)], ratio[int((1 - alpha / 2) * resamples) - 1]
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'bootstrap confidence interval benchmark')
+    cmdlineparser.add_argument('--leaves', type = int, default = 5000)
+    cmdlineparser.add_argument('--samples', type = int, default = 10)
+    cmdlineparser.add_argument('--resamples', type = int, default = 10000)
+    cmdlineparser.add_argument('--loop-leaves', type = int, default = 5,
+                               help = 'leaves done by the per leaf loop')
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+
+    rnd = random.Random(0)
+    base = ColumnarGroup(list(map(lambda s:make_sample('base-%d' % s, ns.leaves, rnd), range(ns.samples))))
+    this = ColumnarGroup(list(map(lambda s:make_sample('this-%d' % s, ns.leaves, rnd), range(ns.samples))))
+
+    start = time.perf_counter()
+    this.bootstrap_diff_ratio(base, ns.resamples, seed = 0)
+    t_new = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(ns.loop_leaves):
+        per_leaf(base.data[:, i].tolist(), this.data[:, i].tolist(), ns.resamples, 0.95, rnd)
+    t_old = (time.perf_counter() - start) / ns.loop_leaves * ns.leaves
+
+    print('%d leaves x %d resamples' % (ns.leaves, ns.resamples))
+    print('per leaf loop (extrapolated): %8.2f s' % t_old)
+    print('batched resampling:           %8.2f s' % t_new)
+    print('speedup:                      %8.2f x' % (t_old / t_new))
+
+if __name__ == '__main__':
+    main()
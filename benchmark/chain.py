@@ -0,0 +1,97 @@
+''' The chained operators of statIOzone.main (average -> diff_ratio ->
+scale_multiply -> user_defined), with the spec and the travel done from
+scratch at every step vs. the cached spec and the compiled leaf plan.'''
+
+import sys
+import time
+import random
+import argparse
+sys.path.insert(0, '.')
+from namedtree import (NamedTree, Operator, named_tree_get_common,
+                       named_tree_travel, _spec_cache, _plan_cache)
+
+IO_PATTERN = ('write', 'rewrite', 'read', 'reread', 'random read', 'random write',
+              'bkwd read', 'record rewirte', 'stride read', 'fwrite', 'frewrite',
+              'fread', 'freread')
+KB = (4194304, 8388608, 16777216, 33554432)
+RECLEN = (4096, 8192, 16384)
+
+def make_sample(name, rnd):
+    tree = {}
+    for pt in IO_PATTERN:
+        tree[pt] = {}
+        for kb in KB:
+            tree[pt][kb] = {}
+            for rl in RECLEN:
+                tree[pt][kb][rl] = rnd.randint(100000, 5000000)
+    return NamedTree(name, tree)
+
+def uncached(op, *T_list, **user_data):
+    ''' what each operator call did before the plans '''
+    t_list = list(map(lambda T:T.get_tree(), T_list))
+    t_spec = named_tree_get_common(t_list, T_list)
+    data = {'T_list':T_list, 'user_data':user_data}
+    r_tree = named_tree_travel(op, t_spec, t_list, data)
+    return NamedTree('uncached', r_tree)
+
+def leaf_average(path, k, t_list, data):
+    return sum(map(lambda t: t[k], t_list)) / len(t_list)
+
+def leaf_diff_ratio(path, k, t_list, data):
+    return (t_list[1][k] - t_list[0][k]) / t_list[0][k]
+
+def leaf_scale(path, k, t_list, data):
+    return t_list[0][k] * data['scale']
+
+def leaf_note(path, k, t_list, data):
+    return data['cb_func']([t_list[0][k]])
+
+def note(v_list):
+    return '***' if v_list[0] < -0.1 else '   '
+
+def chain_uncached(products):
+    averages = list(map(lambda db:uncached(leaf_average, *db), products))
+    base = averages[0]
+    for this in averages[1:]:
+        ratio = uncached(leaf_diff_ratio, base, this)
+        uncached(leaf_scale, ratio, scale = 100)
+        uncached(leaf_note, ratio, cb_func = note)
+
+def chain_planned(products):
+    averages = list(map(lambda db:Operator.average(*db), products))
+    base = averages[0]
+    for this in averages[1:]:
+        ratio = Operator.diff_ratio(base, this)
+        Operator.scale_multiply(ratio, scale = 100)
+        Operator.user_defined(ratio, cb_func = note)
+
+def measure(func, products, repeat):
+    best = None
+    for i in range(repeat):
+        _spec_cache.clear()
+        _plan_cache.clear()
+        start = time.perf_counter()
+        func(products)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'chained operators benchmark')
+    cmdlineparser.add_argument('--products', type = int, default = 6)
+    cmdlineparser.add_argument('--samples', type = int, default = 20)
+    cmdlineparser.add_argument('--repeat', type = int, default = 5)
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+
+    rnd = random.Random(0)
+    products = list(map(lambda p:list(map(lambda s:make_sample('%d-%d' % (p, s), rnd),
+                                          range(ns.samples))),
+                        range(ns.products)))
+    t_old = measure(chain_uncached, products, ns.repeat)
+    t_new = measure(chain_planned, products, ns.repeat)
+    print('uncached spec + travel: %8.2f ms' % (t_old * 1000))
+    print('cached spec + plan:     %8.2f ms' % (t_new * 1000))
+    print('speedup:                %8.2f x' % (t_old / t_new))
+
+if __name__ == '__main__':
+    main()
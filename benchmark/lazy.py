@@ -0,0 +1,77 @@
+''' The comparison chain of statIOzone.main (diff_ratio -> scale_multiply,
+user_defined) rendered by NamedTreeGroup.leaf_print, with every operator
+building its tree vs. lazy operators evaluated in one walk. The walks are
+the calls of LeafPlan.travel and LeafPlan.values, the allocations are
+counted by tracemalloc.'''
+
+import io
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+sys.path.insert(0, '.')
+from namedtree import NamedTreeGroup, LeafPlan, Operator, _spec_cache, _plan_cache
+from benchmark.chain import make_sample
+
+def note(v_list):
+    return '***' if v_list[0] < -0.1 else '   '
+
+def chain(averages, lazy):
+    base = averages[0]
+    r_list = [base]
+    for this in averages[1:]:
+        ratio = Operator.diff_ratio(base, this, lazy = lazy)
+        percent = Operator.scale_multiply(ratio, scale = 100, lazy = lazy)
+        percent.name = 'Fluctuation'
+        ratio_note = Operator.user_defined(ratio, cb_func = note, lazy = lazy)
+        ratio_note.name = 'ratio_note'
+        r_list.extend((this, percent, ratio_note))
+    NamedTreeGroup(*r_list).leaf_print(out = io.StringIO())
+
+def count_walks():
+    walks = [0]
+    def counted(func):
+        def wrapper(*args, **kwargs):
+            walks[0] += 1
+            return func(*args, **kwargs)
+        return wrapper
+    LeafPlan.travel = counted(LeafPlan.travel)
+    LeafPlan.values = counted(LeafPlan.values)
+    return walks
+
+def measure(averages, lazy, repeat, walks):
+    best = None
+    for i in range(repeat):
+        _spec_cache.clear()
+        _plan_cache.clear()
+        start = time.perf_counter()
+        chain(averages, lazy)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    walks[0] = 0
+    tracemalloc.start()
+    chain(averages, lazy)
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(map(lambda s:s.count, snapshot.statistics('filename')))
+    return best, walks[0], blocks, peak
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'lazy operators benchmark')
+    cmdlineparser.add_argument('--products', type = int, default = 6)
+    cmdlineparser.add_argument('--repeat', type = int, default = 5)
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+
+    rnd = random.Random(0)
+    averages = list(map(lambda p:make_sample('product-%d' % p, rnd), range(ns.products)))
+    walks = count_walks()
+    for name, lazy in (('eager', False), ('lazy', True)):
+        t, n, blocks, peak = measure(averages, lazy, ns.repeat, walks)
+        print('%-6s %8.2f ms  %3d walks  %6d live blocks  %8.1f KB peak' %
+              (name, t * 1000, n, blocks, peak / 1024))
+
+if __name__ == '__main__':
+    main()
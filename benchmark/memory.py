@@ -0,0 +1,93 @@
+''' The resident memory of many IOzoneSample loaded at once, with the
+nested dict trees vs. the compact typed arrays (NamedTree.compact), and
+the size of a sample of each class.
+The logs of iozone/ are loaded again and again, each mode is measured in
+its own process.'''
+
+import os
+import sys
+import glob
+import time
+import argparse
+import resource
+import subprocess
+sys.path.insert(0, '.')
+
+MODES = ('dict', 'compact')
+
+def rss_kb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        # the peak, not the current one
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def load(mode, logs, samples):
+    from statIOzone import IOzoneSample
+    db = []
+    for i in range(samples):
+        t = IOzoneSample(logs[i % len(logs)], 'sample-%d' % i)
+        if mode == 'dict':
+            t.parse_default()
+            t.fd.close()
+            t.fd = None
+        else:
+            t.parse_mmap()
+            t.compact()
+        db.append(t)
+    return db
+
+def child(mode, logs, samples):
+    # the modules (and numpy) are not counted
+    import statIOzone
+    before = rss_kb()
+    start = time.perf_counter()
+    db = load(mode, logs, samples)
+    elapsed = time.perf_counter() - start
+    print('%d %f' % (rss_kb() - before, elapsed))
+
+def instance_sizes():
+    ''' The bytes of an unparsed sample of each class, its __dict__ included
+    if it has one (its __slots__ miss an attribute) '''
+    from statIOzone import IOzoneSample
+    from statBonnie import BonnieSample
+    from statTiobench import TiobenchSample
+    for cls in (IOzoneSample, BonnieSample, TiobenchSample):
+        t = cls('log', 'sample')
+        t.meta = None
+        size = sys.getsizeof(t)
+        if hasattr(t, '__dict__'):
+            size += sys.getsizeof(t.__dict__)
+        print('%-16s %4d B/sample  %s' % (cls.__name__, size,
+                                          '__dict__' if hasattr(t, '__dict__') else '__slots__'))
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'sample memory benchmark')
+    cmdlineparser.add_argument('--samples', type = int, default = 10000)
+    cmdlineparser.add_argument('--logs', default = 'iozone/*/*/qa_iozone_4-32G')
+    cmdlineparser.add_argument('--child', choices = MODES, help = argparse.SUPPRESS)
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+
+    logs = sorted(glob.glob(ns.logs))
+    if len(logs) == 0:
+        print('no log matches %s' % ns.logs)
+        return
+    if ns.child:
+        child(ns.child, logs, ns.samples)
+        return
+
+    instance_sizes()
+    result = {}
+    for mode in MODES:
+        out = subprocess.check_output([sys.executable, '-m', 'benchmark.memory',
+                                       '--samples', str(ns.samples), '--logs', ns.logs,
+                                       '--child', mode])
+        kb, elapsed = out.split()
+        result[mode] = int(kb)
+        print('%-8s %8d KB  %6.0f B/sample  %6.2f s' %
+              (mode, int(kb), int(kb) * 1024 / ns.samples, float(elapsed)))
+    print('reduction: %.1f x' % (result['dict'] / max(1, result['compact'])))
+
+if __name__ == '__main__':
+    main()
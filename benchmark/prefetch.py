@@ -0,0 +1,44 @@
+''' The parsing of the IOzone runs of a directory with the logs read one
+after the other, or stat-ed and read ahead by threads (see ctcs2.iter_parsed).
+On a local disk in the page cache the threads only add their overhead,
+the directory to look at is one on a network filesystem:
+
+    python3 -m benchmark.prefetch /mnt/results/SLE12 --prefetch 0 8 32
+'''
+
+import sys
+import time
+import tempfile
+import argparse
+sys.path.insert(0, '.')
+from benchmark import synth
+import ctcs2
+
+def run(dirname, prefetch):
+    from statIOzone import IOzoneSample
+    start = time.perf_counter()
+    DB = ctcs2.LogDB(dirname)
+    db = DB.samples('qa_iozone_4-32G', 'qa_iozone_4-32G', IOzoneSample)
+    ctcs2.parse_samples(db, 'parse_mmap', prefetch = prefetch)
+    return len(db), time.perf_counter() - start
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'prefetching reader benchmark')
+    cmdlineparser.add_argument('db', nargs = '?', help = 'a directory of IOzone runs; synthetic runs by default')
+    cmdlineparser.add_argument('--runs', type = int, default = 500, help = 'synthetic runs')
+    cmdlineparser.add_argument('--prefetch', type = int, nargs = '+', default = [0, 8, 32])
+    cmdlineparser.add_argument('--repeat', type = int, default = 3, help = 'the best time is kept')
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+
+    with tempfile.TemporaryDirectory(prefix = 'perf-log-analyse-') as root:
+        dirname = ns.db or synth.generate(root, 'iozone', 1, ns.runs)[0]
+        for prefetch in ns.prefetch:
+            best = None
+            for i in range(ns.repeat):
+                n, elapsed = run(dirname, prefetch)
+                best = elapsed if best is None else min(best, elapsed)
+            print('prefetch %3d  %6d runs  %8.1f ms  %6.2f ms/run' %
+                  (prefetch, n, best * 1000, best * 1000 / max(1, n)))
+
+if __name__ == '__main__':
+    main()
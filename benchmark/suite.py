@@ -0,0 +1,165 @@
+''' End to end timing of the stages of the stat tools on synthetic runs
+(see benchmark.synth): discovery (LogDB.samples), parsing, spec
+extraction, aggregation (the average of each product and the diff ratio
+chain against the first one) and rendering (leaf_print).
+
+The report is JSON, and a previous report given with --baseline is
+compared stage by stage; the exit status is 1 if a stage is slower than
+the baseline by more than --tolerance.
+
+    python3 -m benchmark.suite --runs 200 --output new.json --baseline old.json
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+sys.path.insert(0, '.')
+from namedtree import NamedTree, NamedTreeGroup, _spec_cache, _plan_cache
+from benchmark import synth
+import ctcs2
+
+REPORT_VERSION = 1
+STAGES = ('discovery', 'parsing', 'spec', 'aggregation', 'rendering')
+
+def sample_class(kind):
+    ''' the sample class and its parse method '''
+    if kind == 'iozone':
+        from statIOzone import IOzoneSample
+        return IOzoneSample, 'parse_mmap'
+    if kind == 'bonnie':
+        from statBonnie import BonnieSample
+        return BonnieSample, 'parse'
+    from statTiobench import TiobenchSample
+    return TiobenchSample, 'parse'
+
+def run_stages(kind, dirs, backend, jobs):
+    test, log_name = synth.KIND[kind][0:2]
+    cls, parse = sample_class(kind)
+    _spec_cache.clear()
+    _plan_cache.clear()
+    elapsed = {}
+
+    start = time.perf_counter()
+    products = list(map(lambda d:ctcs2.LogDB(d).samples(test, log_name, cls), dirs))
+    elapsed['discovery'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for db in products:
+        ctcs2.parse_samples(db, parse, jobs)
+    elapsed['parsing'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for db in products:
+        NamedTree.extract_spec(*db)
+    elapsed['spec'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    averages = []
+    for d, db in zip(dirs, products):
+        average = NamedTreeGroup(*db, backend = backend).average()
+        average.name = os.path.basename(d)
+        averages.append(average)
+    r_list = [averages[0]]
+    for this in averages[1:]:
+        # as perfstat
+        ratio = NamedTree.Operator.safe_diff_ratio(averages[0], this, lazy = True)
+        percent = NamedTree.Operator.scale_multiply(ratio, scale = 100, lazy = True)
+        ratio_note = NamedTree.Operator.regression_note(ratio, lazy = True)
+        r_list.extend((this, percent, ratio_note))
+    group = NamedTreeGroup(*r_list)
+    elapsed['aggregation'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    out = io.StringIO()
+    group.leaf_print(out = out)
+    elapsed['rendering'] = time.perf_counter() - start
+
+    counts = {'samples': sum(map(len, products)),
+              'leaves': len(NamedTree.compile_plan(*averages).paths),
+              'rows': out.getvalue().count('\n')}
+    return elapsed, counts
+
+def compare(report, baseline, tolerance, floor):
+    ''' print the stages against the baseline, return the regressions '''
+    regressions = []
+    print('%-10s %-12s %10s %10s %8s' % ('kind', 'stage', 'baseline', 'now', 'ratio'))
+    for kind, stages in sorted(report['stages'].items()):
+        for stage in STAGES:
+            old = baseline.get('stages', {}).get(kind, {}).get(stage)
+            new = stages[stage]
+            if old is None:
+                print('%-10s %-12s %10s %9.1fms' % (kind, stage, '-', new * 1000))
+                continue
+            ratio = new / old if old > 0 else 1.0
+            slower = ratio > 1 + tolerance and new - old > floor
+            if slower:
+                regressions.append((kind, stage, ratio))
+            print('%-10s %-12s %8.1fms %8.1fms %7.2fx%s' %
+                  (kind, stage, old * 1000, new * 1000, ratio, '  ***' if slower else ''))
+    return regressions
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'end to end stage benchmark')
+    cmdlineparser.add_argument('--kind', nargs = '+', choices = sorted(synth.KIND),
+                               default = sorted(synth.KIND))
+    cmdlineparser.add_argument('--products', type = int, default = 2)
+    cmdlineparser.add_argument('--runs', type = int, default = 50, help = 'runs per product')
+    cmdlineparser.add_argument('--scale', type = int, default = 4, help = 'see benchmark.synth')
+    cmdlineparser.add_argument('--backend', choices = ('dict', 'columnar'), default = 'columnar')
+    cmdlineparser.add_argument('-j', '--jobs', type = int, default = 1)
+    cmdlineparser.add_argument('--repeat', type = int, default = 3, help = 'the best time of each stage is kept')
+    cmdlineparser.add_argument('--root', help = 'where the runs are generated, kept and reused; a temporary directory by default')
+    cmdlineparser.add_argument('--output', help = 'write the JSON report there')
+    cmdlineparser.add_argument('--baseline', help = 'a previous JSON report to compare with')
+    cmdlineparser.add_argument('--tolerance', type = float, default = 0.2,
+                               help = 'a stage slower than the baseline by more than this ratio is a regression')
+    cmdlineparser.add_argument('--floor', type = float, default = 0.005,
+                               help = 'seconds, smaller differences are noise')
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+
+    root = ns.root or tempfile.mkdtemp(prefix = 'perf-log-analyse-')
+    report = {'version': REPORT_VERSION,
+              'python': platform.python_version(),
+              'config': {'products': ns.products, 'runs': ns.runs, 'scale': ns.scale,
+                         'backend': ns.backend, 'jobs': ns.jobs, 'repeat': ns.repeat},
+              'stages': {}, 'counts': {}}
+    try:
+        for kind in ns.kind:
+            kind_root = os.path.join(root, '%s-%d-%d-%d' % (kind, ns.products, ns.runs, ns.scale))
+            if os.path.isdir(kind_root):
+                dirs = sorted(map(lambda d:os.path.join(kind_root, d), os.listdir(kind_root)))
+            else:
+                dirs = synth.generate(kind_root, kind, ns.products, ns.runs, ns.scale)
+            best = {}
+            for i in range(ns.repeat):
+                elapsed, counts = run_stages(kind, dirs, ns.backend, ns.jobs)
+                for stage in STAGES:
+                    best[stage] = min(best.get(stage, elapsed[stage]), elapsed[stage])
+            report['stages'][kind] = best
+            report['counts'][kind] = counts
+    finally:
+        if not ns.root:
+            shutil.rmtree(root)
+
+    if ns.output:
+        with open(ns.output, 'w') as f:
+            json.dump(report, f, indent = 2, sort_keys = True)
+    baseline = {}
+    if ns.baseline:
+        with open(ns.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            print('the baseline was run with %s' % baseline.get('config'))
+    regressions = compare(report, baseline, ns.tolerance, ns.floor)
+    if regressions:
+        print('%d stages are slower than the baseline' % len(regressions))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
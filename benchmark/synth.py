@@ -0,0 +1,132 @@
+''' Synthetic run directories for the benchmarks.
+
+A product directory has runs named <test>-YYYY-MM-DD-HH-MM-SS, as
+ctcs2.LogDB.samples expects, each with the log of the test, a kernel
+file (rpm -qi) and a done file. The logs are in the format of the real
+ones in iozone/ and samples/, with random results around a base value
+per product, so two products compare like two kernels do.
+
+    python3 -m benchmark.synth /tmp/runs --kind iozone --products 2 --runs 100
+'''
+
+import os
+import sys
+import random
+import argparse
+import datetime
+
+IO_PATTERN = ('write', 'rewrite', 'read', 'reread', 'random read', 'random write',
+              'bkwd read', 'record rewirte', 'stride read', 'fwrite', 'frewrite',
+              'fread', 'freread')
+BONNIE_SIZE = ((100, 1), (256, 1), (512, 1), (1024, 1), (1024, 2), (1024, 4),
+               (1024, 8), (1024, 16))
+TIOBENCH_SECTION = ('Sequential Reads', 'Random Reads', 'Sequential Writes', 'Random Writes')
+
+def iozone_log(rnd, base, scale):
+    ''' scale is the number of file sizes, from 4G, doubling '''
+    lines = ['\tIozone: Performance Test of File I/O',
+             '\t        Version $Revision: 3.300 $',
+             '',
+             '\tAuto Mode',
+             '\tOutput is in Kbytes/sec',
+             '                                                            random  random    bkwd  record  stride                                   ',
+             '              KB  reclen   write rewrite    read    reread    read   write    read rewrite    read   fwrite frewrite   fread  freread']
+    for i in range(scale):
+        kb = 4194304 << i
+        for reclen in (4096, 8192, 16384):
+            results = map(lambda b:'%7d' % max(1, int(rnd.gauss(b, b * 0.05))), base)
+            lines.append('%16d  %6d ' % (kb, reclen) + ' '.join(results))
+    lines.append('')
+    lines.append('iozone test complete.')
+    return '\n'.join(lines) + '\n'
+
+def bonnie_log(rnd, base, scale):
+    ''' scale is the number of sizes, at most len(BONNIE_SIZE) '''
+    blocks = []
+    for size, volumes in BONNIE_SIZE[:scale]:
+        cells = ['apac2-ph026', '%d * %d' % (size, volumes)]
+        for kb_s, cpu in base:
+            cells.append('%d' % max(1, int(rnd.gauss(kb_s, kb_s * 0.05))))
+            cells.append('%4.1f' % max(0.1, rnd.gauss(cpu, cpu * 0.05)))
+        blocks.append('\n'.join([
+            'Needing %d MB, having 137143 MB' % size,
+            "Bonnie 1.4: File '/abuild/Bonnie.1963', size: %d, volumes: %d" % (size << 20, volumes),
+            'Using O_DIRECT for block based I/O',
+            'Seeker 1...Seeker 2...Seeker 3...start \'em...done...done...done...',
+            '<TR>' + ''.join(map(lambda c:'<TD>%s</TD>' % c, cells)) + '</TR>',
+            '0 fail 1 succeed 1 count 0 internal_error 0 skipped']))
+    return '--\n' + '\n--\n'.join(blocks) + '\n'
+
+def tiobench_log(rnd, base, scale):
+    ''' scale is the number of block sizes, from 4096, times 8 '''
+    lines = ['Unit information', '================', '']
+    for section, (rate, cpu, lat) in zip(TIOBENCH_SECTION, base):
+        lines.append(section)
+        for i in range(scale):
+            blksize = 4096 << (3 * i)
+            for threads in (1, 2, 4, 8):
+                r = max(0.01, rnd.gauss(rate, rate * 0.05))
+                c = max(0.01, rnd.gauss(cpu * threads, cpu * 0.05))
+                l = max(0.001, rnd.gauss(lat * threads, lat * 0.05))
+                lines.append('%-28s %6d %6d %4d %11.2f %5.2f%% %9.3f %11.2f   0.00000  0.00000 %5d' %
+                             ('3.12.22-2-xen', 32768, blksize, threads, r, c, l, l * 100, r / c * 100))
+        lines.append('')
+    return '\n'.join(lines)
+
+# test name, log file name, log writer, results of a product: the same
+# random ones for all products, with the throughput multiplied by factor
+KIND = {
+    'iozone': ('qa_iozone_4-32G', 'qa_iozone_4-32G', iozone_log,
+               lambda rnd, factor:list(map(lambda i:rnd.randint(80000, 5000000) * factor, IO_PATTERN))),
+    'bonnie': ('bonnie-directIO', 'bonnie-directIO', bonnie_log,
+               lambda rnd, factor:list(map(lambda i:(rnd.randint(20000, 130000) * factor, rnd.uniform(4, 70)),
+                                           range(6)))),
+    'tiobench': ('tiobench-bench', 'tiobench', tiobench_log,
+                 lambda rnd, factor:list(map(lambda s:(rnd.uniform(1, 120) * factor, rnd.uniform(5, 30),
+                                                       rnd.uniform(0.01, 3)),
+                                             TIOBENCH_SECTION))),
+}
+
+KERNEL = '''Name        : kernel-default
+Version     : %s
+Release     : 1.4
+Architecture: x86_64
+'''
+
+def generate(root, kind, products = 2, runs = 10, scale = 4, seed = 0):
+    ''' Write the products product-0, product-1... under root, return their
+    directories '''
+    test, log_name, writer, make_base = KIND[kind]
+    rnd = random.Random(seed)
+    start = datetime.datetime(2014, 1, 1)
+    dirs = []
+    for p in range(products):
+        product_dir = os.path.join(root, 'product-%d' % p)
+        base = make_base(random.Random(seed), rnd.uniform(0.9, 1.1))
+        for r in range(runs):
+            when = start + datetime.timedelta(hours = 6 * r, seconds = p)
+            run_dir = os.path.join(product_dir, when.strftime(test + '-%Y-%m-%d-%H-%M-%S'))
+            os.makedirs(run_dir, exist_ok = True)
+            with open(os.path.join(run_dir, log_name), 'w') as f:
+                f.write(writer(rnd, base, scale))
+            with open(os.path.join(run_dir, 'kernel'), 'w') as f:
+                f.write(KERNEL % ('3.12.%d' % p))
+            open(os.path.join(run_dir, 'done'), 'w').close()
+        dirs.append(product_dir)
+    return dirs
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'synthetic run directories')
+    cmdlineparser.add_argument('root')
+    cmdlineparser.add_argument('--kind', choices = sorted(KIND), default = 'iozone')
+    cmdlineparser.add_argument('--products', type = int, default = 2)
+    cmdlineparser.add_argument('--runs', type = int, default = 10, help = 'runs per product')
+    cmdlineparser.add_argument('--scale', type = int, default = 4,
+                               help = 'file sizes (iozone), sizes (bonnie) or block sizes (tiobench) per run')
+    cmdlineparser.add_argument('--seed', type = int, default = 0)
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+    for d in generate(ns.root, ns.kind, ns.products, ns.runs, ns.scale, ns.seed):
+        print(d)
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,41 @@
+import io
 import re
 import os
+import sys
+import logging
+import stageprofile
+from collections import namedtuple
+
+log = logging.getLogger()
+
+# <test>-YYYY-MM-DD-HH-MM-SS, the name of a run directory
+RUN_PT = re.compile(r'^(.+)-(\d{4}-\d{2}-\d{2})-(\d{2})-(\d{2})-(\d{2})$')
+
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar.xz', '.txz', '.tar.bz2', '.tbz2', '.tar')
+# the files of a run besides the logs, only read from an archive when asked for
+METADATA = ('kernel', 'rpmlist', 'environment', 'timer_state', 'hwinfo',
+            'process_state', 'test_results')
+
+# the attributes of the samples set here (and filename and fd, the log and
+# its file object while it is parsed), for the __slots__ of the sample classes
+SAMPLE_SLOTS = ('filename', 'fd', 'meta', 'archive', 'content', 'stat')
+
+def archive_suffix(path):
+    for suffix in ARCHIVE_SUFFIXES:
+        if path.endswith(suffix):
+            return suffix
+    return None
 
 class LogDB:
-    def __init__(self, dirname):
+    ''' The run directories of a product: a directory, or an archive
+    (see ARCHIVE_SUFFIXES) of run directories read without extracting it.
+    An archive is read once, in one pass, the first time its runs are
+    asked for (or by scan_archives); only the logs named in logs (a
+    function of the test and the file name, or the names), all of them
+    when it is None, and the METADATA files in metadata are kept in
+    memory. '''
+
+    def __init__(self, dirname, metadata = (), logs = None):
         assert isinstance(dirname, str)
         assert dirname != ''
 
@@ -11,16 +44,596 @@ class LogDB:
             self.log_dir = dirname[0:-1]
         else:
             self.log_dir = dirname
-        self.name = os.path.basename(self.log_dir)
+        suffix = archive_suffix(self.log_dir)
+        if suffix and os.path.isfile(self.log_dir):
+            self.archive = self.log_dir
+            self.name = os.path.basename(self.log_dir)[:-len(suffix)]
+        else:
+            self.archive = None
+            self.name = os.path.basename(self.log_dir)
+        self.metadata = metadata
+        if logs is None or callable(logs):
+            self.logs = logs
+        else:
+            self.logs = lambda test, name, logs = frozenset(logs):name in logs
+        # the runs of the archive: name -> (member directory, {file name: content})
+        self._runs = None
+        # the listing of the directory, each listing of a remote one costs round trips
+        self._names = None
+
+    def scan(self):
+        ''' Read the archive, if it is one and it is not read yet '''
+        if self.archive is None or self._runs is not None:
+            return
+        import tarfile
+        runs = {}
+        # a stream, the members are read in the order they are stored
+        with tarfile.open(self.archive, 'r|*') as tar:
+            for m in tar:
+                if not m.isfile():
+                    continue
+                run_path, sep, name = os.path.normpath(m.name).rpartition('/')
+                run = os.path.basename(run_path)
+                r = RUN_PT.match(run)
+                if not r:
+                    continue
+                entry = runs.setdefault(run, (run_path, {}))
+                if entry[0] != run_path:
+                    log.warning('[LogDB] %s: %s is also in %s, ignored' % (self.archive, m.name, entry[0]))
+                    continue
+                if name in METADATA:
+                    if name not in self.metadata:
+                        continue
+                elif name != 'done' and self.logs is not None and not self.logs(r.group(1), name):
+                    continue
+                entry[1][name] = tar.extractfile(m).read()
+                stageprofile.count('archive bytes read', m.size)
+        self._runs = runs
+
+    def rescan(self):
+        ''' Read the archive, or list the directory, again the next time '''
+        self._runs = None
+        self._names = None
+
+    def listdir(self):
+        ''' The names in the directory, the run directories of an archive.
+        The directory is listed once, until rescan(). '''
+        if self.archive is None:
+            if self._names is None:
+                self._names = os.listdir(self.log_dir)
+            return list(self._names)
+        self.scan()
+        return list(self._runs)
+
+    def done(self, name):
+        ''' whether the run directory name has a done file '''
+        if self.archive is None:
+            return os.path.exists(self.log_dir + '/' + name + '/done')
+        self.scan()
+        return name in self._runs and 'done' in self._runs[name][1]
+
+    def tests(self):
+        ''' The run directories by test name, in order, from one listing '''
+        tests = {}
+        for name in sorted(self.listdir()):
+            r = RUN_PT.match(name)
+            if r:
+                tests.setdefault(r.group(1), []).append(name)
+        return tests
+
+    @staticmethod
+    def run_pattern(db_path):
+        return re.compile('%s-(\d{4}-\d{2}-\d{2})-(\d{2})-(\d{2})-(\d{2})' % db_path)
+
+    def sample(self, name, r, db_name, sample_class):
+        ''' The sample of the run directory name, r its run_pattern match '''
+        sample_name = db_name + '_' + "%sT%s:%s:%s" % (r.group(1), r.group(2),
+                                       r.group(3), r.group(4))
+        if self.archive is None:
+            filename = self.log_dir + '/' + name + '/' + db_name
+            t = sample_class(filename, sample_name)
+            t.meta = RunMetadata(self.log_dir + '/' + name)
+            return t
+        self.scan()
+        run_path, members = self._runs[name]
+        # not a file, see open_log
+        t = sample_class(self.archive + '/' + run_path + '/' + db_name, sample_name)
+        t.archive = self.archive
+        t.content = members.get(db_name)
+        t.meta = RunMetadata(self.archive + '/' + run_path, self.archive, members)
+        return t
 
     def samples(self, db_path, db_name, sample_class):
         db = list()
-        path_pt = re.compile('%s-(\d{4}-\d{2}-\d{2})-(\d{2})-(\d{2})-(\d{2})' % db_path)
-        for name in os.listdir(self.log_dir):
+        path_pt = self.run_pattern(db_path)
+        # sorted, so the samples are in the same order at every run
+        for name in sorted(self.listdir()):
             r = path_pt.match(name)
             if r:
-                sample_name = db_name + '_' + "%sT%s:%s:%s" % (r.group(1), r.group(2),
-                                               r.group(3), r.group(4))
-                filename = self.log_dir + '/' + name + '/' + db_name
-                db.append(sample_class(filename, sample_name))
+                db.append(self.sample(name, r, db_name, sample_class))
+        stageprofile.count('files discovered', len(db))
+        return db
+
+    def load(self, db_path, db_name, sample_class, parse, jobs = 1, cache = None):
+        ''' samples() with each sample parsed by its method named parse '''
+        db = self.samples(db_path, db_name, sample_class)
+        parse_samples(db, parse, jobs, cache)
+        return db
+
+def scan_archives(DB_list, jobs = 1):
+    ''' Read the archives among the LogDB of DB_list, jobs (0 means one per
+    cpu) at a time. The decompression runs outside of the GIL, in threads. '''
+    todo = list(filter(lambda DB:DB.archive is not None and DB._runs is None, DB_list))
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1 or len(todo) <= 1:
+        for DB in todo:
+            DB.scan()
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers = min(jobs, len(todo))) as pool:
+        list(pool.map(lambda DB:DB.scan(), todo))
+
+class RunWatcher:
+    ''' The runs of a LogDB finished since the last poll, a run is finished
+    once its directory has a done file. The directory is only listed again
+    when its mtime changed, otherwise a poll only looks for the done file
+    of the runs not finished yet, so the cost of a poll does not grow with
+    the runs already returned. '''
+
+    def __init__(self, DB, db_path, db_name, sample_class):
+        self.DB = DB
+        self.path_pt = LogDB.run_pattern(db_path)
+        self.db_name = db_name
+        self.sample_class = sample_class
+        self.mtime_ns = None
+        # the runs already returned, and the ones without a done file yet
+        self.seen = set()
+        self.pending = set()
+
+    def poll(self):
+        ''' The samples of the runs finished since the last poll, in order '''
+        log_dir = self.DB.log_dir
+        try:
+            mtime_ns = os.stat(log_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime_ns != self.mtime_ns:
+            # the mtime is taken first, a run added while listing is seen by the next poll
+            self.mtime_ns = mtime_ns
+            self.DB.rescan()
+            for name in self.DB.listdir():
+                if name not in self.seen and self.path_pt.match(name):
+                    self.pending.add(name)
+        done = sorted(filter(self.DB.done, self.pending))
+        self.pending.difference_update(done)
+        self.seen.update(done)
+        db = list(map(lambda name:self.DB.sample(name, self.path_pt.match(name),
+                                                 self.db_name, self.sample_class), done))
+        stageprofile.count('files discovered', len(db))
+        return db
+
+def open_log(t, binary = False):
+    ''' The log of the sample t: its file, or a file object over its
+    content when it was read from an archive (see LogDB) or read ahead
+    (see iter_parsed) '''
+    content = getattr(t, 'content', None)
+    if content is None:
+        if getattr(t, 'archive', None) is None:
+            f = open(t.filename, 'rb' if binary else 'r')
+            if stageprofile.enabled():
+                stageprofile.count('bytes read', os.fstat(f.fileno()).st_size)
+            return f
+        raise FileNotFoundError('%s: no such member' % t.filename)
+    stageprofile.count('bytes read', len(content))
+    if binary:
+        return io.BytesIO(content)
+    # the newlines are translated as by open()
+    return io.TextIOWrapper(io.BytesIO(content), errors = 'replace')
+
+def _parse_sample(args):
+    ''' Run in the worker processes, only the tree is sent back '''
+    (sample_class, filename, name, parse, archive, content) = args
+    t = sample_class(filename, name)
+    if archive is not None:
+        t.archive = archive
+        t.content = content
+    getattr(t, parse)()
+    if t.fd:
+        t.fd.close()
+    return t.get_tree()
+
+def stat_logs(db, jobs = 8):
+    ''' Stat the logs of the samples of db (not the ones of an archive),
+    jobs at a time in threads, into t.stat, None when it fails. One stat
+    after the other costs a round trip each on a network filesystem. '''
+    todo = list(filter(lambda t:getattr(t, 'archive', None) is None, db))
+    def stat(t):
+        try:
+            t.stat = os.stat(t.filename)
+        except OSError:
+            t.stat = None
+    if jobs <= 1 or len(todo) <= 1:
+        list(map(stat, todo))
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers = min(jobs, len(todo))) as pool:
+        list(pool.map(stat, todo))
+
+def _read_log(t):
+    with open(t.filename, 'rb') as f:
+        return f.read()
+
+def iter_parsed(db, parse, jobs = 1, cache = None, prefetch = 0):
+    ''' Yield the samples of db, in order, once each is parsed by its method
+    named parse. With jobs > 1 (0 means one per cpu), the samples are parsed
+    by a pool of processes and the trees are set back to the samples.
+    With a cache (see parsecache.ParseCache), the samples found in it are
+    not parsed at all, and the others are added to it.
+    With prefetch threads, the logs are stat-ed by that many threads at
+    once, and, if parsed in this process (jobs == 1), read ahead by them
+    into t.content (see open_log); for the logs on a network filesystem.
+    The samples are looked up in the cache, parsed or read only a few
+    (4 per process or thread) ahead of the one yielded, so the trees in
+    memory do not grow with the number of samples. '''
+    from collections import deque
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if prefetch:
+        # for the cache and the profile
+        stat_logs(db, prefetch)
+
+    pool = reader = None
+    ahead = 1
+    if jobs != 1 and len(db) > 1:
+        # imported here, it is most of the import time of this module
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers = min(jobs, len(db)))
+        ahead = 4 * jobs
+    elif prefetch:
+        from concurrent.futures import ThreadPoolExecutor
+        reader = ThreadPoolExecutor(max_workers = prefetch)
+        ahead = 4 * prefetch
+
+    # (sample, cached tree, future of its tree or of its log)
+    window = deque()
+    queue = iter(db)
+    parsed = 0
+    def submit():
+        for t in queue:
+            tree = cache.get(t, parse) if cache else None
+            if tree is not None:
+                stageprofile.count('samples from cache')
+                window.append((t, tree, None))
+            elif pool is not None:
+                window.append((t, None, pool.submit(_parse_sample, (type(t), t.filename, t.name, parse,
+                                                                    getattr(t, 'archive', None),
+                                                                    getattr(t, 'content', None)))))
+            elif reader is not None and getattr(t, 'archive', None) is None:
+                window.append((t, None, reader.submit(_read_log, t)))
+            else:
+                window.append((t, None, None))
+            return True
+        return False
+
+    try:
+        while True:
+            while len(window) < ahead and submit():
+                pass
+            if len(window) == 0:
+                break
+            t, tree, future = window.popleft()
+            if tree is not None:
+                t.set_tree(tree)
+                yield t
+                continue
+            stageprofile.count('samples parsed')
+            parsed += 1
+            if pool is not None:
+                t.set_tree(future.result())
+            else:
+                if future is not None:
+                    try:
+                        t.content = future.result()
+                        stageprofile.count('bytes prefetched', len(t.content))
+                    except OSError as error:
+                        # left to the parser, which opens the log as usual
+                        log.warning('[ctcs2] [prefetch] %s' % error)
+                getattr(t, parse)()
+                if future is not None:
+                    t.content = None
+            if cache:
+                cache.put(t, parse, t.get_tree())
+            yield t
+    finally:
+        for executor in (pool, reader):
+            if executor is not None:
+                executor.shutdown(cancel_futures = True)
+    if cache and parsed != 0:
+        cache.evict()
+
+def parse_samples(db, parse, jobs = 1, cache = None, compact = False, prefetch = 0):
+    ''' Parse all the samples of db, see iter_parsed. With compact, each
+    tree is compacted (see NamedTree.compact) as soon as it is parsed. '''
+    for t in iter_parsed(db, parse, jobs, cache, prefetch):
+        if compact:
+            t.compact()
+    return db
+
+Run = namedtuple('Run', ('path', 'product', 'test', 'timestamp', 'kernel', 'done'))
+
+KERNEL_INFO_PT = re.compile(r'(?:^|\s{2,})(\w[\w ]*?)\s*: ?(.*?)(?=\s{2,}\w[\w ]*?\s*: |$)')
+
+# (name, version) of the packages, shared by all the runs
+_packages = {}
+
+def _package(name, version):
+    p = (name, version)
+    return _packages.setdefault(p, (sys.intern(name), sys.intern(version)))
+
+class RunMetadata:
+    ''' The files of a run directory besides the log (kernel, rpmlist,
+    environment, timer_state, hwinfo). Each one is only read and parsed
+    the first time it is asked for, then kept.
+    The packages are interned (name, version) pairs in a frozenset, so the
+    packages of two runs are compared with set operations. '''
+
+    def __init__(self, run_dir, archive = None, members = None):
+        self.run_dir = run_dir
+        # a run of an archive: run_dir is archive/member directory, and
+        # members the files read with the logs (see LogDB)
+        self.archive = archive
+        self.members = members
+        self._cache = {}
+
+    def _read_member(self, name):
+        ''' A file skipped when the archive was read: read it again, up to it '''
+        import tarfile
+        member = self.run_dir[len(self.archive) + 1:] + '/' + name
+        log.debug('[RunMetadata] read %s from %s again' % (member, self.archive))
+        with tarfile.open(self.archive, 'r|*') as tar:
+            for m in tar:
+                # like LogDB.scan, ./run/file is run/file
+                if m.isfile() and os.path.normpath(m.name) == member:
+                    return tar.extractfile(m).read()
+        raise FileNotFoundError('%s: no member %s' % (self.archive, member))
+
+    def _lines(self, name):
+        if self.archive is None:
+            with open(self.run_dir + '/' + name, errors = 'replace') as f:
+                return f.read().splitlines()
+        if name not in self.members:
+            self.members[name] = self._read_member(name)
+        return self.members[name].decode(errors = 'replace').splitlines()
+
+    def _get(self, name, parse):
+        if name not in self._cache:
+            try:
+                self._cache[name] = parse(self._lines(name))
+            except OSError as error:
+                log.debug('[RunMetadata] %s: %s' % (self.run_dir, error))
+                self._cache[name] = None
+        return self._cache[name]
+
+    @staticmethod
+    def _parse_kernel(lines):
+        ''' rpm -qi output, older rpm prints two "key : value" per line '''
+        info = {}
+        for line in lines:
+            for r in KERNEL_INFO_PT.finditer(line):
+                info.setdefault(r.group(1), r.group(2).strip())
+        return info
+
+    @staticmethod
+    def _parse_rpmlist(lines):
+        packages = []
+        for line in lines:
+            name, sep, version = line.strip().partition(' ')
+            if sep:
+                packages.append(_package(name, version.strip()))
+        return frozenset(packages)
+
+    @staticmethod
+    def _parse_pairs(lines):
+        ''' environment and timer_state: a line for the key, the next one for its value '''
+        return dict(zip(lines[0::2], lines[1::2]))
+
+    @staticmethod
+    def _parse_hwinfo(lines):
+        ''' a list of devices, each the dict of its top level "key: value" lines '''
+        devices = []
+        device = None
+        for line in lines:
+            if not line.strip():
+                device = None
+            elif not line.startswith(' '):
+                device = {'': line.strip()}
+                devices.append(device)
+            elif device is not None and line.startswith('  ') and line[2] != ' ':
+                k, sep, v = line.partition(':')
+                if sep:
+                    device.setdefault(sys.intern(k.strip()), v.strip())
+        return devices
+
+    @property
+    def kernel(self):
+        return self._get('kernel', self._parse_kernel)
+
+    @property
+    def kernel_version(self):
+        ''' version-release of the kernel package '''
+        info = self.kernel
+        if not info or 'Version' not in info:
+            return None
+        if 'Release' in info:
+            return info['Version'] + '-' + info['Release']
+        return info['Version']
+
+    @property
+    def packages(self):
+        return self._get('rpmlist', self._parse_rpmlist)
+
+    @property
+    def environment(self):
+        return self._get('environment', self._parse_pairs)
+
+    @property
+    def timer_state(self):
+        return self._get('timer_state', self._parse_pairs)
+
+    @property
+    def hwinfo(self):
+        return self._get('hwinfo', self._parse_hwinfo)
+
+    def diff(self, other):
+        ''' What changed from self to other: the kernels, and the
+        added, removed and changed (name, old version, new version)
+        packages '''
+        old = self.packages or frozenset()
+        new = other.packages or frozenset()
+        removed = old - new
+        added = new - old
+        old_versions = dict(removed)
+        changed = []
+        for name, version in sorted(added):
+            if name in old_versions:
+                changed.append((name, old_versions[name], version))
+        changed_names = set(map(lambda c:c[0], changed))
+        return {'kernel': (self.kernel_version, other.kernel_version),
+                'added': sorted(filter(lambda p:p[0] not in changed_names, added)),
+                'removed': sorted(filter(lambda p:p[0] not in changed_names, removed)),
+                'changed': changed}
+
+class RunCatalog:
+    ''' A sqlite catalog of the run directories.
+    update() records the runs found in a results directory and in its
+    product subdirectories (SLE11SP3, beta7, ...), only listing the
+    directories whose mtime changed since the last update and looking
+    again at the runs not done yet. query() then answers from the catalog
+    alone, without touching the file system. '''
+
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+    CREATE TABLE IF NOT EXISTS runs (path TEXT PRIMARY KEY, dir TEXT, product TEXT,
+                                     test TEXT, timestamp TEXT, kernel TEXT,
+                                     done INTEGER, mtime_ns INTEGER);
+    CREATE INDEX IF NOT EXISTS runs_dir ON runs (dir);
+    CREATE INDEX IF NOT EXISTS runs_query ON runs (test, product, timestamp);
+    '''
+
+    def __init__(self, filename):
+        import sqlite3
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(self.SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, root):
+        ''' Scan root and its subdirectories, return the number of runs
+        added or refreshed '''
+        root = os.path.abspath(root)
+        with self.db:
+            n = self._update_dir(root, None, True)
+            for (path,) in self.db.execute('SELECT path FROM dirs WHERE parent = ?', (root,)).fetchall():
+                n += self._update_dir(path, root, False)
+        return n
+
+    def _update_dir(self, path, parent, subdirs):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self.db.execute('DELETE FROM dirs WHERE path = ? OR parent = ?', (path, path))
+            self.db.execute('DELETE FROM runs WHERE dir = ?', (path,))
+            return 0
+        row = self.db.execute('SELECT mtime_ns FROM dirs WHERE path = ?', (path,)).fetchone()
+        if row and row[0] == mtime_ns:
+            # nothing added or removed, only the runs not done may change
+            todo = self.db.execute('SELECT path, mtime_ns FROM runs WHERE dir = ? AND done = 0',
+                                   (path,)).fetchall()
+            return self._update_runs(path, dict(todo), list(map(lambda r:r[0], todo)))
+
+        self.db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)', (path, parent, mtime_ns))
+        known = dict(self.db.execute('SELECT path, mtime_ns FROM runs WHERE dir = ?', (path,)))
+        found = []
+        dirs = []
+        for e in os.scandir(path):
+            if not e.is_dir():
+                continue
+            if RUN_PT.match(e.name):
+                found.append(e.path)
+            elif subdirs:
+                dirs.append(e.path)
+        for gone in set(known) - set(found):
+            self.db.execute('DELETE FROM runs WHERE path = ?', (gone,))
+        if subdirs:
+            known_dirs = set(map(lambda r:r[0], self.db.execute(
+                'SELECT path FROM dirs WHERE parent = ?', (path,))))
+            for gone in known_dirs - set(dirs):
+                self.db.execute('DELETE FROM dirs WHERE path = ?', (gone,))
+                self.db.execute('DELETE FROM runs WHERE dir = ?', (gone,))
+            for d in dirs:
+                if d not in known_dirs:
+                    self.db.execute('INSERT INTO dirs VALUES (?, ?, NULL)', (d, path))
+        return self._update_runs(path, known, found)
+
+    def _update_runs(self, path, known, runs):
+        n = 0
+        product = os.path.basename(path)
+        for run in runs:
+            try:
+                mtime_ns = os.stat(run).st_mtime_ns
+            except FileNotFoundError:
+                self.db.execute('DELETE FROM runs WHERE path = ?', (run,))
+                continue
+            if known.get(run) == mtime_ns:
+                continue
+            r = RUN_PT.match(os.path.basename(run))
+            timestamp = '%sT%s:%s:%s' % (r.group(2), r.group(3), r.group(4), r.group(5))
+            done = int(os.path.exists(run + '/done'))
+            self.db.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (run, path, product, r.group(1), timestamp,
+                             RunMetadata(run).kernel_version, done, mtime_ns))
+            n += 1
+        return n
+
+    def query(self, test = None, product = None, since = None, until = None, done = None, dir = None):
+        ''' The runs, ordered by timestamp. test is a glob pattern
+        (qa_iozone_*), since and until are dates or timestamps
+        (2014-06-04, 2014-06-04T19:35:09), until is inclusive. product is
+        the name of the directory of the runs, the same in two results
+        directories; dir is its absolute path. '''
+        sql = 'SELECT path, product, test, timestamp, kernel, done FROM runs WHERE 1'
+        args = []
+        if test is not None:
+            sql += ' AND test GLOB ?'
+            args.append(test)
+        if product is not None:
+            sql += ' AND product = ?'
+            args.append(product)
+        if dir is not None:
+            sql += ' AND dir = ?'
+            args.append(os.path.abspath(dir))
+        if since is not None:
+            sql += ' AND timestamp >= ?'
+            args.append(since)
+        if until is not None:
+            # a date alone means the whole day
+            sql += ' AND timestamp <= ?'
+            args.append(until if 'T' in until else until + 'T99')
+        if done is not None:
+            sql += ' AND done = ?'
+            args.append(int(done))
+        sql += ' ORDER BY timestamp, path'
+        return list(map(lambda r:Run(*r), self.db.execute(sql, args)))
+
+    def samples(self, db_name, sample_class, **query):
+        ''' Like LogDB.samples, for the runs of query() '''
+        db = list()
+        for run in self.query(**query):
+            sample_name = db_name + '_' + run.timestamp
+            t = sample_class(run.path + '/' + db_name, sample_name)
+            t.meta = RunMetadata(run.path)
+            db.append(t)
+        stageprofile.count('files discovered', len(db))
         return db
@@ -1,22 +1,21 @@
 import sys
-from collections import OrderedDict, Set
+import csv
+import json
+import math
+from array import array
+from collections import OrderedDict
 import logging
+import stageprofile
 
-__all__ = ['NamedTree', 'NamedTreeGroup', 'OP_KIND_LEAF', 'OP_KIND_DIR']
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-log = logging.getLogger()
-
-def _get_key_set(t_list):
-    key_uset = set()
-    for l in t_list:
-        key_uset |= l.keys()
+__all__ = ['NamedTree', 'LazyTree', 'NamedTreeGroup', 'ColumnarGroup', 'StreamingStats',
+           'QuantileSketch', 'PathIndex', 'ANY', 'OP_KIND_LEAF', 'OP_KIND_DIR']
 
-    key_iset = key_uset
-    for l in t_list:
-        key_iset &= l.keys()
-
-    key_dset = key_uset - key_iset
-    return key_uset, key_iset, key_dset
+log = logging.getLogger()
 
 (CHK_OK, CHK_NO_ITEM, CHK_NOT_DICT) = list(range(0,3))
 def _check_key(k, t_list, i_list, error):
@@ -59,76 +58,72 @@ def _check_dir(k, t_list, i_list, error):
         error[0], error[1] = (CHK_NOT_DICT, _list)
         return False
 
-def _check_file(k, t_list, i_list, error):
-    iter_t = iter(t_list)
-    iter_i = iter(i_list)
-    _list = []
-    while True:
-        try:
-            t = next(iter_t)
-            i = next(iter_i)
-            if isinstance(t[k], dict):
-                _list.append(i)
-        except StopIteration:
-            break
-
-    if len(_list) == 0:
-        # Do not touch error
-        return True
-    else:
-        error[0], error[1] = (CHK_NOT_DICT, _list)
-        return False
-
-def named_tree_get_common(t_list, i_list):
+def named_tree_get_common(t_list, i_list, report = None):
     ''' Get the common structure of a list of named_tree
     i_info should be iteratable and each one is for each tree
-    each info should have the name property for debug'''
-    stack = []
-    path = []
-    error = [CHK_OK, None]
+    each info should have the name property for debug
+
+    All the trees are walked together, once: at every directory, each key
+    of each tree is counted with the number of trees having it as a dict,
+    so a key is classified as common (in all trees), partial (in some
+    trees only) or conflicting (a dict in some trees, a value in others)
+    without another pass. If report is a dict, report['partial'] is filled
+    with (path, names of the trees having it, names of the others) and
+    report['conflict'] with (path, names of the trees having a dict, names
+    of the trees having a value).'''
+    partial = []
+    conflict = []
 
-    key_uset, key_iset, key_dset = _get_key_set(t_list)
-    key_uset = sorted(key_uset)
     root_node = OrderedDict()
-    for e in key_uset:
-        root_node[e] = None
-    t_spec = root_node
-    iter_iset = iter(key_iset)
-
-    while True:
-        try:
-            k = next(iter_iset)
-        except StopIteration:
-            if len(stack) == 0:
-                break
-            else:
-                si = stack.pop()
-                (t_list, t_spec, iter_iset) = si
-                path.pop()
-        else:
-            if _check_dir(k, t_list, i_list, error):
-                si = (t_list, t_spec, iter_iset)
-                stack.append(si)
-                path.append(str(k))
-                t_list = list(map(lambda d:d[k], t_list))
-                key_uset, key_iset, key_dset = _get_key_set(t_list)
-                key_uset = sorted(key_uset)
-                new_node = OrderedDict()
-                for e in key_uset:
-                    new_node[e] = None
-                t_spec[k] = new_node
-                t_spec = new_node
-                iter_iset = iter(key_iset)
-            elif _check_file(k, t_list, i_list, error):
-                log.debug('[NamedTree] [SPEC] node %s is the value' %
-                          ('/'.join(path)+'/'+ str(k)))
-            else:
-                log.warning('[NamedTree] [SPEC] unmatched data found')
-                for i in i_list:
-                    if i not in error[1]:
-                        log.warning('[NamedTree] [SPEC] %s of %s is NOT a dict' % ('/' + '/'.join(path)+'/'+k, i.name))
-                    else:
-                        log.warning('[NamedTree] [SPEC] %s of %s is a dict' % ('/' + '/'.join(path)+'/'+k, i.name))
+    stack = [(root_node, t_list, ())]
+    while len(stack) != 0:
+        (t_spec, t_list, path) = stack.pop()
+        n = len(t_list)
+        counts = {}
+        for t in t_list:
+            for k, v in t.items():
+                c = counts.get(k)
+                if c is None:
+                    c = counts[k] = [0, 0]
+                c[0] += 1
+                if isinstance(v, dict):
+                    c[1] += 1
+
+        for k in sorted(counts):
+            t_spec[k] = None
+        for k, (n_item, n_dict) in counts.items():
+            if n_item != n:
+                partial.append((path + (k,), t_list))
+            elif n_dict == n:
+                t_spec[k] = OrderedDict()
+                stack.append((t_spec[k], list(map(lambda d:d[k], t_list)), path + (k,)))
+            elif n_dict != 0:
+                conflict.append((path + (k,), t_list))
+
+    if len(partial) != 0 or len(conflict) != 0:
+        # only the unusual keys are looked up again to name the trees
+        def _split(where, t_list, match):
+            k = where[-1]
+            yes, no = [], []
+            for t, i in zip(t_list, i_list):
+                if match(t, k):
+                    yes.append(i.name)
+                else:
+                    no.append(i.name)
+            return ('/' + '/'.join(map(str, where)), yes, no)
+        partial = list(map(lambda e:_split(e[0], e[1], lambda t, k:k in t), partial))
+        conflict = list(map(lambda e:_split(e[0], e[1],
+                                            lambda t, k:isinstance(t[k], dict)), conflict))
+    if len(partial) != 0:
+        log.debug('[NamedTree] [SPEC] %d nodes are not in all the trees: %s' %
+                  (len(partial), ', '.join(map(lambda e:e[0], partial[:10]))))
+    if len(conflict) != 0:
+        log.warning('[NamedTree] [SPEC] unmatched data found: %d nodes are a dict in some trees and a value in others: %s' %
+                    (len(conflict), ', '.join(map(lambda e:e[0], conflict[:10]))))
+
+    if report is not None:
+        report['partial'] = partial
+        report['conflict'] = conflict
     return root_node
 
 (OP_KIND_LEAF, OP_KIND_DIR) = list(range(0,2))
@@ -189,77 +184,606 @@ def named_tree_travel(op, t_spec, t_list, data, kind = OP_KIND_LEAF):
                     log.fatal('[NamedTree] [Travel] UNKNOWN kind of operation')
     return root_node
 
+def named_tree_leaf_paths(t_spec):
+    ''' Flatten t_spec into a list of leaf paths (tuples of keys).
+    The order is the same as the one named_tree_travel visits the leaves.'''
+    paths = []
+    stack = []
+    path = ()
+    iter_spec = iter(t_spec.items())
+    while True:
+        try:
+            k, sub_spec = next(iter_spec)
+        except StopIteration:
+            if len(stack) == 0:
+                break
+            (path, iter_spec) = stack.pop()
+        else:
+            if isinstance(sub_spec, dict):
+                stack.append((path, iter_spec))
+                path = path + (k,)
+                iter_spec = iter(sub_spec.items())
+            else:
+                paths.append(path + (k,))
+    return paths
+
+def named_tree_from_leaves(paths, values):
+    ''' Build a nested dict from leaf paths and their values '''
+    root_node = {}
+    for p, v in zip(paths, values):
+        node = root_node
+        for k in p[:-1]:
+            if k not in node:
+                node[k] = {}
+            node = node[k]
+        node[p[-1]] = v
+    return root_node
+
+def named_tree_shape(tree):
+    ''' The structural key of a tree: a nested tuple of (key, sub shape),
+    the sub shape of a leaf is None. Trees with the same keys at the same
+    places have equal shapes, whatever the values are.'''
+    return tuple((k, named_tree_shape(v) if isinstance(v, dict) else None)
+                 for k, v in tree.items())
+
+def named_tree_from_shape(shape):
+    ''' A tree of the shape, with None at the leaves '''
+    return dict(map(lambda e:(e[0], None if e[1] is None else named_tree_from_shape(e[1])), shape))
+
+(PLAN_ENTER, PLAN_LEAF, PLAN_LEAVE) = list(range(0,3))
+_NO_ITEM = object()
+class LeafPlan:
+    ''' A precompiled travel plan over the common part of some trees.
+    The spec is checked against the shapes of the trees once, when the plan
+    is compiled, and the result is a flat list of instructions:
+        (PLAN_ENTER, k, path, sub_spec, index of the matching PLAN_LEAVE)
+        (PLAN_LEAF, k, path, index of the PLAN_ENTER of its parent)
+        (PLAN_LEAVE,)
+    so travelling the trees afterwards needs no check at all.
+    '''
+
+    def __init__(self, t_spec, shapes, i_list = ()):
+        self.spec = t_spec
+        self.code = []
+        self.paths = []
+        # the names of the trees of each shape (shapes has each one once)
+        self._names = []
+        if i_list:
+            self._names = list(map(lambda s:', '.join(map(lambda T:T.name,
+                                                           filter(lambda T:T.get_shape() == s, i_list))),
+                                   shapes))
+        s_list = list(map(dict, shapes))
+        self.result_shape = self._compile(t_spec, s_list, (), -1)
+
+    def _compile(self, t_spec, s_list, keys, enter):
+        code = self.code
+        path = list(map(str, keys))
+        shape = []
+        for k, v in t_spec.items():
+            subs = list(map(lambda s:s.get(k, _NO_ITEM), s_list))
+            where = '/' + '/'.join(path + [str(k)])
+            if any(map(lambda sub:sub is _NO_ITEM, subs)):
+                for n, sub in zip(self._names, subs):
+                    if sub is _NO_ITEM:
+                        log.warning('[NamedTree] [Plan] %s has no value at %s' % (n, where))
+            elif isinstance(v, dict):
+                if None in subs:
+                    raise TypeError('[NamedTree] [Plan] %s is NOT a dict in all the trees' % where)
+                sub_enter = len(code)
+                code.append(None)
+                sub_shape = self._compile(v, list(map(dict, subs)), keys + (k,), sub_enter)
+                code[sub_enter] = (PLAN_ENTER, k, path + [str(k)], v, len(code))
+                code.append((PLAN_LEAVE,))
+                shape.append((k, sub_shape))
+            elif any(map(lambda sub:sub is not None, subs)):
+                log.warning('[NamedTree] [Plan] %s is a dict in some trees only' % where)
+            else:
+                code.append((PLAN_LEAF, k, path, enter))
+                self.paths.append(keys + (k,))
+                shape.append((k, None))
+        return tuple(shape)
+
+    def travel(self, op, t_list, user_data, kind = OP_KIND_LEAF):
+        stageprofile.count('leaves traversed', len(self.paths))
+        code = self.code
+        stack = []
+        root_node = {}
+        t_result = root_node
+        t_spec = self.spec
+        i = 0
+        end = len(code)
+        while i < end:
+            c = code[i]
+            if c[0] == PLAN_LEAF:
+                if kind == OP_KIND_LEAF:
+                    t_result[c[1]] = op(c[2], c[1], t_list, user_data)
+                else:
+                    tmp = op(c[2], t_spec, t_list, user_data)
+                    i = code[c[3]][4]
+                    (t_list, t_spec, t_result, k) = stack.pop()
+                    t_result[k] = tmp
+            elif c[0] == PLAN_ENTER:
+                k = c[1]
+                stack.append((t_list, t_spec, t_result, k))
+                t_list = list(map(lambda d:d[k], t_list))
+                t_spec = c[3]
+                t_result[k] = {}
+                t_result = t_result[k]
+            else:
+                (t_list, t_spec, t_result, k) = stack.pop()
+            i += 1
+        return root_node
+
+    def values(self, tree):
+        ''' The leaf values of one tree, in the order of self.paths '''
+        values = []
+        stack = []
+        for c in self.code:
+            if c[0] == PLAN_LEAF:
+                values.append(tree[c[1]])
+            elif c[0] == PLAN_ENTER:
+                stack.append(tree)
+                tree = tree[c[1]]
+            else:
+                tree = stack.pop()
+        return values
+
+def _leaf_typecode(values):
+    ''' The array typecode of the leaf values, None if they are not all numbers '''
+    if all(map(lambda v:type(v) is int and -2**31 <= v < 2**31, values)):
+        return 'i'
+    if all(map(lambda v:type(v) is float or (type(v) is int and -2**24 <= v <= 2**24), values)):
+        return 'f'
+    if all(map(lambda v:type(v) in (int, float), values)):
+        return 'd'
+    return None
+
+_PLAN_CACHE_SIZE = 64
+_spec_cache = OrderedDict()
+_plan_cache = OrderedDict()
+
+def _cache_put(cache, key, value):
+    cache[key] = value
+    if len(cache) > _PLAN_CACHE_SIZE:
+        cache.popitem(last = False)
+
+# the wildcard of a path pattern, see PathIndex.select
+ANY = '*'
+
+def _match_keys(keys, p):
+    ''' The keys (in their order) matching the pattern item p: ANY, a slice
+    (start included, stop excluded, like range), a set of keys or a key '''
+    if p is ANY or p == ANY:
+        return list(keys)
+    if isinstance(p, slice):
+        def inside(k):
+            try:
+                return (p.start is None or k >= p.start) and (p.stop is None or k < p.stop)
+            except TypeError:
+                return False
+        return list(filter(inside, keys))
+    if isinstance(p, (set, frozenset)):
+        return list(filter(lambda k:k in p, keys))
+    return [p] if p in keys else []
+
+def parse_path_pattern(text):
+    ''' 'read/*/4096' -> ('read', ANY, 4096); an item may also be a range
+    of numbers, 4194304:16777216, or keys separated by commas '''
+    def number(v):
+        try:
+            return int(v)
+        except ValueError:
+            try:
+                return float(v)
+            except ValueError:
+                return v
+    pattern = []
+    for item in text.strip('/').split('/'):
+        if item == ANY:
+            pattern.append(ANY)
+        elif ':' in item:
+            start, stop = item.split(':', 1)
+            pattern.append(slice(number(start) if start else None, number(stop) if stop else None))
+        elif ',' in item:
+            pattern.append(frozenset(map(number, item.split(','))))
+        else:
+            pattern.append(number(item))
+    return tuple(pattern)
+
+class PathIndex:
+    ''' The position of each leaf path of a list of paths in plan order
+    (LeafPlan.paths), and of each inner path the range of the positions of
+    the leaves under it: they are contiguous, the plan being depth first.
+    A leaf is found in O(1) and a pattern is matched by walking the inner
+    paths it names only, not all the leaves. '''
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.leaf = dict(map(lambda e:(e[1], e[0]), enumerate(paths)))
+        # inner path -> {key: [start, end]}, in the order of the keys
+        self.children = {}
+        for i, p in enumerate(paths):
+            for d in range(len(p)):
+                c = self.children.setdefault(p[:d], OrderedDict())
+                span = c.get(p[d])
+                if span is None:
+                    c[p[d]] = [i, i + 1]
+                else:
+                    span[1] = i + 1
+
+    def select(self, pattern):
+        ''' The (start, end) position ranges of the leaves under the paths
+        matching pattern, a tuple of keys, ANY, slices or sets of keys. A
+        pattern shorter than the paths selects everything under it. '''
+        spans = []
+        def walk(prefix, span, d):
+            if d == len(pattern):
+                if spans and spans[-1][1] == span[0]:
+                    spans[-1] = (spans[-1][0], span[1])
+                else:
+                    spans.append(tuple(span))
+                return
+            children = self.children.get(prefix)
+            if children is None:
+                # a leaf, the pattern is longer
+                return
+            for k in _match_keys(children, pattern[d]):
+                walk(prefix + (k,), children[k], d + 1)
+        walk((), (0, len(self.paths)), 0)
+        return spans
+
+    def paths_in(self, spans):
+        if len(spans) == 1:
+            return self.paths[spans[0][0]:spans[0][1]]
+        return [p for s, e in spans for p in self.paths[s:e]]
+
+    @staticmethod
+    def positions(spans):
+        return [i for s, e in spans for i in range(s, e)]
+
+_index_cache = OrderedDict()
+
+def path_index(paths):
+    ''' The PathIndex of a list of leaf paths, shared by the trees over the
+    same list (the paths of a plan, of compact trees, of lazy results) '''
+    entry = _index_cache.get(id(paths))
+    if entry is None or entry[0] is not paths:
+        entry = (paths, PathIndex(paths))
+        _cache_put(_index_cache, id(paths), entry)
+    return entry[1]
+
 class NamedTree:
     ''' Could be used as a info for a named tree  '''
     #TODO change 'vector' to 'list'
     @classmethod
     def extract_spec(cls, *T_list):
-        for T in T_list:
-            if T.spec:
-                return T.spec
-        t_list = list(map(lambda T:T.get_tree(), T_list))
-        t_spec = named_tree_get_common(t_list, T_list)
-        return t_spec
+        ''' The common spec of the trees, it only depends on their shapes
+        (T.spec is the spec of the last group of T, not of these trees) '''
+        with stageprofile.stage('spec'):
+            key = cls._shapes_key(T_list)
+            if key in _spec_cache:
+                return _spec_cache[key]
+            # the pending results have a shape but no values yet
+            t_list = list(map(lambda T:named_tree_from_shape(T.get_shape()) if isinstance(T, LazyTree) and T.pending()
+                              else T.get_tree(), T_list))
+            t_spec = named_tree_get_common(t_list, T_list)
+            _cache_put(_spec_cache, key, t_spec)
+            return t_spec
+
+    @classmethod
+    def compile_plan(cls, *T_list):
+        ''' Trees of the same shapes share the same plan '''
+        key = cls._shapes_key(T_list)
+        if key in _plan_cache:
+            return _plan_cache[key]
+        t_spec = cls.extract_spec(*T_list)
+        plan = LeafPlan(t_spec, key, T_list)
+        _cache_put(_plan_cache, key, plan)
+        return plan
+
+    @staticmethod
+    def _shapes_key(T_list):
+        return tuple(OrderedDict.fromkeys(map(lambda T:T.get_shape(), T_list)))
+
+    # the render state is in NamedTreeGroup.LeafRender
+    __slots__ = ('name', 'tree', 'spec', 'shape', 'leaves')
 
     def __init__(self, name, tree = None):
         self.name = name
         self.tree = tree
         self.spec = None
-        # attributes for print
-        self.header_width = None
-        self.data_width = None
-        self.field_width = None
-        self.field_format_spec_start = None
-        self.field_format_spec_end = None
-        self.field_format_spec = None
-        self.field_prefix = None
-        self.field_suffix = None
+        self.shape = None
+        # (leaf paths, values) when the nested dicts are not kept
+        self.leaves = None
 
     def get_tree(self):
+        if self.tree is None and self.leaves is not None:
+            # a compact tree is rebuilt at every call, not kept
+            return named_tree_from_leaves(*self.leaves)
         return self.tree
 
     def set_tree(self, tree):
         self.tree = tree
+        self.shape = None
+        self.leaves = None
+
+    def leaf_values(self, plan):
+        ''' The leaf values in the order of plan.paths '''
+        if self.leaves is not None and self.leaves[0] == plan.paths:
+            return self.leaves[1]
+        return plan.values(self.get_tree())
+
+    def compact(self):
+        ''' Keep the leaves in a typed array over the leaf paths of the plan
+        shared by the trees of the same shape, and drop the nested dicts.
+        The array is int32 if the leaves are all int32, float32 if there are
+        float (rounded to about 7 digits) and int up to 2**24, float64 for
+        bigger int. A tree with other leaves is left as it is. '''
+        plan = NamedTree.compile_plan(self)
+        values = plan.values(self.get_tree())
+        typecode = _leaf_typecode(values)
+        if typecode is None:
+            return
+        self.tree = None
+        self.leaves = (plan.paths, array(typecode, values))
+        # the trees rebuilt from the leaves are in the order of the plan
+        self.shape = plan.result_shape
+
+    def get_shape(self):
+        ''' The shape is computed on the first call, so the tree should not
+        be changed afterwards but by set_tree '''
+        if self.shape is None:
+            self.shape = named_tree_shape(self.get_tree() or {})
+        return self.shape
 
     def set_name(self, name):
         self.name = name
 
     def _get_branch(self, path):
-        '''TODO test'''
-        if not self.tree:
-            return {}
-        node = self.tree
+        node = self.get_tree() or {}
         for name in path:
-            node=node[name]
+            if not isinstance(node, dict):
+                raise KeyError('%s: %s is a file' % (self.name, '/'.join(map(str, path))))
+            node = node[name]
         return node
 
     def get_branch(self, path):
-        '''TODO test'''
+        ''' The sub tree at path, its dicts are the ones of this tree '''
         t = self._get_branch(path)
-        name = '/'.join(path)
-        return NamedTree(name, t)
+        if not isinstance(t, dict):
+            raise KeyError('%s: %s is a file' % (self.name, '/'.join(map(str, path))))
+        return NamedTree('/'.join(map(str, path)), t)
+
+    def _dict_tree(self):
+        ''' The nested dicts, kept from now on if the tree was compact '''
+        tree = self.get_tree()
+        if tree is None:
+            tree = {}
+        if self.tree is not tree:
+            self.set_tree(tree)
+        return tree
 
     def set_branch(self, path, dir_v):
-        raise NotImplementedError()
+        ''' Put the dict (or the tree of the NamedTree) dir_v at path, the
+        dicts on the way are created if needed '''
+        if isinstance(dir_v, NamedTree):
+            dir_v = dir_v.get_tree()
+        if len(path) == 0:
+            self.set_tree(dir_v)
+            return
+        node = self._dict_tree()
+        for name in path[:-1]:
+            node = node.setdefault(name, {})
+            if not isinstance(node, dict):
+                raise KeyError('%s: %s is a file' % (self.name, '/'.join(map(str, path))))
+        node[path[-1]] = dir_v
+        self.set_tree(self.tree)
+
+    def path_index(self):
+        ''' The PathIndex of the leaves of this tree '''
+        if self.tree is None and self.leaves is not None:
+            return path_index(self.leaves[0])
+        return path_index(NamedTree.compile_plan(self).paths)
 
     def get_file(self, path):
-        raise NotImplementedError()
+        ''' The leaf at path, KeyError if there is none. The leaves of a
+        compact tree are found by the PathIndex. '''
+        if self.tree is None and self.leaves is not None:
+            return self.leaves[1][self.path_index().leaf[tuple(path)]]
+        node = self._get_branch(path)
+        if isinstance(node, dict):
+            raise KeyError('%s: %s is a dict' % (self.name, '/'.join(map(str, path))))
+        return node
 
     def set_file(self, path, file_v):
-        raise NotImplementedError()
+        ''' Set the leaf at path, the dicts on the way are created if needed.
+        A leaf of a compact tree is set in place if the array can hold it. '''
+        if self.tree is None and self.leaves is not None:
+            i = self.path_index().leaf.get(tuple(path))
+            if i is not None:
+                try:
+                    self.leaves[1][i] = file_v
+                    return
+                except (TypeError, OverflowError):
+                    # not for this typecode, back to the dicts
+                    pass
+        node = self._dict_tree()
+        for name in path[:-1]:
+            node = node.setdefault(name, {})
+            if not isinstance(node, dict):
+                raise KeyError('%s: %s is a file' % (self.name, '/'.join(map(str, path))))
+        k = path[-1]
+        # a new leaf changes the shape, a new value does not
+        changed = k not in node or isinstance(node[k], dict)
+        node[k] = file_v
+        if changed:
+            self.shape = None
+
+    def select(self, pattern):
+        ''' The leaves matching pattern (see PathIndex.select) as a tree of
+        the same name. Only the matching paths are walked; the leaves of a
+        compact tree in one range are a memoryview of its array. '''
+        if self.tree is None and self.leaves is not None:
+            index = self.path_index()
+            spans = index.select(pattern)
+            values = self.leaves[1]
+            if len(spans) == 1 and isinstance(values, array):
+                values = memoryview(values)[spans[0][0]:spans[0][1]]
+            else:
+                values = list(map(values.__getitem__, index.positions(spans)))
+            paths = index.paths_in(spans)
+        else:
+            paths = []
+            values = []
+            def walk(node, prefix, d):
+                if not isinstance(node, dict):
+                    # a leaf above the end of the pattern does not match
+                    if d == len(pattern):
+                        paths.append(prefix)
+                        values.append(node)
+                    return
+                if d == len(pattern):
+                    for k, v in node.items():
+                        walk(v, prefix + (k,), d)
+                    return
+                for k in _match_keys(node, pattern[d]):
+                    walk(node[k], prefix + (k,), d + 1)
+            tree = self.get_tree()
+            if tree:
+                walk(tree, (), 0)
+        T = NamedTree(self.name)
+        T.leaves = (paths, values)
+        return T
+
+class LazyTree(NamedTree):
+    ''' The pending result of an OP_KIND_LEAF operator called with lazy = True.
+    It is computed by evaluate_lazy, together with the other pending results
+    of a NamedTreeGroup when the group first needs the values, or on the
+    first get_tree(); the csv and json output of a group computes it leaf
+    by leaf instead (see NamedTreeGroup._leaf_rows). The values are kept as
+    a column over the leaf paths, the nested dicts are only built if
+    get_tree() is called.'''
+
+    __slots__ = ('func', 'operands', 'user_data')
+
+    def __init__(self, name, func, operands, user_data):
+        super().__init__(name)
+        self.func = func
+        self.operands = operands
+        self.user_data = user_data
+
+    def pending(self):
+        return self.leaves is None and self.tree is None
+
+    def get_shape(self):
+        ''' The leaves common to the operands, known before the values '''
+        if self.shape is None and self.pending():
+            self.shape = NamedTree.compile_plan(*self.operands).result_shape
+        return super().get_shape()
 
+    def get_tree(self):
+        if self.tree is None:
+            if self.leaves is None:
+                evaluate_lazy([self])
+            shape = self.shape
+            self.set_tree(named_tree_from_leaves(*self.leaves))
+            self.shape = shape
+        return self.tree
+
+def _lazy_nodes(T_list):
+    ''' The pending nodes under T_list, operands first, and the concrete
+    trees under them by id '''
+    def pending(T):
+        return isinstance(T, LazyTree) and T.pending()
+
+    nodes = []
+    sources = OrderedDict()
+    seen = set()
+    stack = list(map(lambda T:(T, False), filter(pending, T_list)))
+    while len(stack) != 0:
+        T, done = stack.pop()
+        if id(T) in seen:
+            continue
+        if not done:
+            stack.append((T, True))
+            stack.extend(map(lambda O:(O, False), filter(pending, reversed(T.operands))))
+            for O in T.operands:
+                if not pending(O):
+                    sources.setdefault(id(O), O)
+            continue
+        seen.add(id(T))
+        nodes.append(T)
+    return nodes, sources
+
+def _lazy_steps(nodes, index):
+    ''' The operands of a node at a leaf are one dict per operand, reused
+    from leaf to leaf, as the operators only look up the key of the leaf:
+    (func, [(cell, row index of the operand)], cells, user_data) per node '''
+    steps = []
+    for N in nodes:
+        cells = list(map(lambda O:{}, N.operands))
+        steps.append((N.func, list(zip(cells, map(lambda O:index[id(O)], N.operands))), cells, N.user_data))
+    return steps
+
+def evaluate_lazy(T_list):
+    ''' Compute the pending LazyTree of T_list in one walk over the leaves
+    common to all the concrete trees under them: every pending node is
+    computed leaf by leaf from the values of its operands at that leaf.
+    Only the results of T_list are kept, the values of the intermediate
+    nodes are dropped. '''
+    nodes, sources = _lazy_nodes(T_list)
+    if len(nodes) == 0:
+        return
+
+    S_list = list(sources.values())
+    plan = NamedTree.compile_plan(*S_list)
+    leaves = list(filter(lambda c:c[0] == PLAN_LEAF, plan.code))
+    # a row holds the values of the sources then the ones of the nodes at a leaf
+    index = dict(map(lambda p:(p[1], p[0]), enumerate(list(sources) + list(map(id, nodes)))))
+    columns = list(map(lambda S:S.leaf_values(plan), S_list))
+    columns.extend(map(lambda N:[], nodes))
+    steps = list(map(lambda s, N:s + (columns[index[id(N)]],), _lazy_steps(nodes, index), nodes))
+    log.debug('[NamedTree] [Lazy] %d nodes over %d trees %d leaves' %
+              (len(nodes), len(S_list), len(leaves)))
+    stageprofile.count('operators executed', len(nodes))
+    stageprofile.count('leaves traversed', len(leaves))
+    n = len(S_list)
+    row = [None] * len(index)
+    for i, c in enumerate(leaves):
+        k = c[1]
+        path = c[2]
+        for j in range(n):
+            row[j] = columns[j][i]
+        j = n
+        for func, operands, cells, user_data, column in steps:
+            for cell, o in operands:
+                cell[k] = row[o]
+            row[j] = func(path, k, cells, user_data)
+            column.append(row[j])
+            j += 1
+
+    wanted = set(map(id, T_list))
+    for N in nodes:
+        if id(N) in wanted:
+            N.leaves = (plan.paths, columns[index[id(N)]])
+            N.shape = plan.result_shape
 
 # a decorator to implement mathmatic operations
 def operator(prefix, kind = OP_KIND_LEAF):
     def real(func):
-        def wrapper(*T_list, **user_data):
-            data = {'T_list':T_list, 'user_data':user_data}
-            t_spec = NamedTree.extract_spec(*T_list)
+        def wrapper(*T_list, lazy = False, **user_data):
+            if lazy and kind == OP_KIND_LEAF:
+                t_names = list(map(lambda T:T.name, T_list))
+                return LazyTree('%s %s' % (prefix, ' '.join(t_names)), func, T_list, user_data)
+            stageprofile.count('operators executed')
+            plan = NamedTree.compile_plan(*T_list)
             t_list = list(map(lambda T:T.get_tree(), T_list))
-            r_tree = named_tree_travel(func, t_spec, t_list, data, kind = kind)
+            r_tree = plan.travel(func, t_list, user_data, kind = kind)
             t_names = list(map(lambda T:T.name, T_list))
             R_tree = NamedTree('%s %s' % (prefix, ' '.join(t_names)))
             R_tree.set_tree(r_tree)
+            if kind == OP_KIND_LEAF:
+                R_tree.shape = plan.result_shape
             return R_tree
         return wrapper
     return real
@@ -303,6 +827,31 @@ class Operator:
         ratio = diff / t_list[0][k]
         return ratio
 
+    # safe_diff_ratio(T1, T2): for the results that may be 0, like the
+    # Lat% of tiobench, 0 against 0 is no change and anything else
+    # against 0 an infinite one
+    @staticmethod
+    @operator('the diff ratio of')
+    def safe_diff_ratio(path, k, t_list, user_data):
+        base, this = t_list[0][k], t_list[1][k]
+        if base == 0:
+            return 0.0 if this == 0 else math.copysign(math.inf, this)
+        return (this - base) / base
+
+    # regression_note(ratio, lower_is_better = f): '***' for a diff ratio
+    # below -10%, or above 10% when f(path, k) says the leaf is better lower
+    @staticmethod
+    @operator('the regression note of')
+    def regression_note(path, k, t_list, user_data):
+        ratio = t_list[0][k]
+        lower_is_better = user_data.get('lower_is_better')
+        if lower_is_better and lower_is_better(path, k):
+            ratio = -ratio
+        if ratio < -0.1:
+            return '***'
+        else:
+            return '   '
+
     # union(*vector)
     @staticmethod
     @operator('the union list of')
@@ -330,56 +879,496 @@ class Operator:
 
     @staticmethod
     def branch(path, *vector):
+        ''' The branch at path of every tree, a KeyError lists the trees
+        without it '''
         error = []
         nv = []
         for T in vector:
             try:
-                nT = T.get_dir(path)
+                nT = T.get_branch(path)
                 nv.append(nT)
             except KeyError as kerror:
-                error.append((T, kerror))
+                error.append((T.name, kerror))
 
         if len(error) != 0:
-            raise keyError(error)
+            raise KeyError(error)
         else:
             return nv
 
 NamedTree.Operator = Operator
 NamedTree.operator = operator
 
+class QuantileSketch:
+    ''' A mergeable, bounded memory quantile sketch.
+    The items of level i weight 2**i. When a level holds k items, they are
+    sorted and every other one goes up to the next level, so it keeps
+    about k * log2(n / k) items for n values, and is exact for n < k.'''
+
+    def __init__(self, k = 128):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+        self._odd = 0
+
+    def add(self, v):
+        self.n += 1
+        self.levels[0].append(v)
+        if len(self.levels[0]) >= self.k:
+            self._compact(0)
+
+    def _compact(self, i):
+        while i < len(self.levels) and len(self.levels[i]) >= self.k:
+            level = sorted(self.levels[i])
+            if i + 1 == len(self.levels):
+                self.levels.append([])
+            # an odd item stays, the pairs give one of them to the next level
+            rest = level[len(level) & ~1:]
+            # alternate the one going up, so the errors do not add up
+            self._odd ^= 1
+            self.levels[i + 1].extend(level[self._odd:len(level) & ~1:2])
+            self.levels[i] = rest
+            i += 1
+
+    def merge(self, other):
+        self.n += other.n
+        for i, level in enumerate(other.levels):
+            if i == len(self.levels):
+                self.levels.append([])
+            self.levels[i].extend(level)
+        for i in range(len(self.levels)):
+            self._compact(i)
+        return self
+
+    def state(self):
+        return {'k': self.k, 'n': self.n, 'levels': self.levels, 'odd': self._odd}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state['k'])
+        sketch.n = state['n']
+        sketch.levels = list(map(list, state['levels']))
+        sketch._odd = state['odd']
+        return sketch
+
+    def quantile(self, q):
+        ''' The value of rank q * n, q in [0, 1] '''
+        items = []
+        for i, level in enumerate(self.levels):
+            w = 1 << i
+            items.extend(map(lambda v:(v, w), level))
+        if len(items) == 0:
+            return None
+        items.sort(key = lambda e:e[0])
+        total = sum(map(lambda e:e[1], items))
+        target = q * total
+        acc = 0
+        for v, w in items:
+            acc += w
+            if acc >= target:
+                return v
+        return items[-1][0]
+
+class StreamingStats:
+    ''' Per leaf statistics of trees folded in one at a time: count, mean
+    and variance (Welford), min, max and a QuantileSketch. The memory
+    depends on the number of leaves, not on the number of trees, and the
+    states of two StreamingStats over the same leaves can be merged.
+    The leaves are the ones of the first tree added.'''
+
+    def __init__(self, name = '', sketch_size = 128):
+        self.name = name
+        self.sketch_size = sketch_size
+        self.paths = None
+        self.shape = None
+        self._plan = None
+        # no leaf until the first tree
+        self.count = self.mean_v = self.m2 = self.min_v = self.max_v = self.sketch = []
+
+    def _init_leaves(self, paths):
+        self.paths = paths
+        n = len(paths)
+        self.count = [0] * n
+        self.mean_v = [0.0] * n
+        self.m2 = [0.0] * n
+        self.min_v = [None] * n
+        self.max_v = [None] * n
+        self.sketch = list(map(lambda i:QuantileSketch(self.sketch_size), range(n)))
+
+    def _values(self, T):
+        if self.paths is None:
+            self._plan = NamedTree.compile_plan(T)
+            self.shape = T.get_shape()
+            self._init_leaves(self._plan.paths)
+        tree = T.get_tree()
+        if T.get_shape() == self.shape:
+            return self._plan.values(tree)
+        # not the same shape, look up the leaves one by one
+        values = []
+        for p in self.paths:
+            node = tree
+            try:
+                for k in p:
+                    node = node[k]
+            except (KeyError, TypeError):
+                log.warning('[NamedTree] [Stats] %s has no value at %s' %
+                            (T.name, '/' + '/'.join(map(str, p))))
+                node = None
+            values.append(node)
+        return values
+
+    def add(self, T):
+        values = self._values(T)
+        count, mean_v, m2 = self.count, self.mean_v, self.m2
+        min_v, max_v, sketch = self.min_v, self.max_v, self.sketch
+        for i, x in enumerate(values):
+            if x is None:
+                continue
+            n = count[i] = count[i] + 1
+            d = x - mean_v[i]
+            mean_v[i] += d / n
+            m2[i] += d * (x - mean_v[i])
+            if n == 1 or x < min_v[i]:
+                min_v[i] = x
+            if n == 1 or x > max_v[i]:
+                max_v[i] = x
+            sketch[i].add(x)
+        return self
+
+    def merge(self, other):
+        ''' Fold the state of other (over the same leaves) into self '''
+        if other.paths is None:
+            return self
+        if self.paths is None:
+            self._plan, self.shape = other._plan, other.shape
+            self._init_leaves(other.paths)
+        if other.paths != self.paths:
+            raise ValueError('[NamedTree] [Stats] merging stats of different leaves')
+        for i in range(len(self.paths)):
+            nb = other.count[i]
+            if nb == 0:
+                continue
+            na = self.count[i]
+            n = na + nb
+            d = other.mean_v[i] - self.mean_v[i]
+            self.mean_v[i] += d * nb / n
+            self.m2[i] += other.m2[i] + d * d * na * nb / n
+            self.count[i] = n
+            if na == 0 or other.min_v[i] < self.min_v[i]:
+                self.min_v[i] = other.min_v[i]
+            if na == 0 or other.max_v[i] > self.max_v[i]:
+                self.max_v[i] = other.max_v[i]
+            self.sketch[i].merge(other.sketch[i])
+        return self
+
+    STATE_VERSION = 1
+
+    def state(self):
+        ''' The whole state as plain lists and dicts (JSON), see from_state '''
+        state = {'version': self.STATE_VERSION, 'name': self.name, 'sketch_size': self.sketch_size,
+                 'paths': None}
+        if self.paths is None:
+            return state
+        state.update(paths = list(map(list, self.paths)), count = self.count, mean = self.mean_v,
+                     m2 = self.m2, min = self.min_v, max = self.max_v,
+                     sketch = list(map(lambda s:s.state(), self.sketch)))
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        if state.get('version') != cls.STATE_VERSION:
+            raise ValueError('[NamedTree] [Stats] unknown state version %s' % state.get('version'))
+        stats = cls(state['name'], state['sketch_size'])
+        if state['paths'] is None:
+            return stats
+        # the trees added later are looked up leaf by leaf, there is no plan
+        stats.paths = list(map(tuple, state['paths']))
+        stats.count = state['count']
+        stats.mean_v = state['mean']
+        stats.m2 = state['m2']
+        stats.min_v = state['min']
+        stats.max_v = state['max']
+        stats.sketch = list(map(QuantileSketch.from_state, state['sketch']))
+        return stats
+
+    def _tree(self, prefix, values):
+        T = NamedTree('%s %s' % (prefix, self.name))
+        if self.paths is None:
+            T.set_tree({})
+            return T
+        paths = []
+        l = []
+        for p, n, v in zip(self.paths, self.count, values):
+            if n != 0:
+                paths.append(p)
+                l.append(v)
+        T.set_tree(named_tree_from_leaves(paths, l))
+        return T
+
+    def get_count(self):
+        return self._tree('the count of', self.count)
+
+    def mean(self):
+        return self._tree('the average of', self.mean_v)
+
+    def variance(self):
+        ''' the sample variance, 0 for a single value '''
+        return self._tree('the variance of',
+                          list(map(lambda n, m2:m2 / (n - 1) if n > 1 else 0.0,
+                                   self.count, self.m2)))
+
+    def stddev(self):
+        return self._tree('the stddev of',
+                          list(map(lambda n, m2:math.sqrt(m2 / (n - 1)) if n > 1 else 0.0,
+                                   self.count, self.m2)))
+
+    def min(self):
+        return self._tree('the min of', self.min_v)
+
+    def max(self):
+        return self._tree('the max of', self.max_v)
+
+    def quantile(self, q):
+        return self._tree('the %g quantile of' % q,
+                          list(map(lambda s:s.quantile(q), self.sketch)))
+
+    def median(self):
+        return self._tree('the median of', list(map(lambda s:s.quantile(0.5), self.sketch)))
+
+def save_stats(filename, stats_list, **info):
+    ''' Write the states of stats_list and info to filename, gzipped JSON '''
+    import gzip
+    with gzip.open(filename, 'wt') as f:
+        json.dump({'info': info, 'stats': list(map(lambda stats:stats.state(), stats_list))}, f)
+
+def load_stats(filename):
+    ''' Return the info and the StreamingStats saved by save_stats '''
+    import gzip
+    with gzip.open(filename, 'rt') as f:
+        saved = json.load(f)
+    return saved['info'], list(map(StreamingStats.from_state, saved['stats']))
+
+class ColumnarGroup:
+    '''The columnar backend of NamedTreeGroup.
+    It keeps one leaf path index shared by all the trees and a 2-D array
+    (samples x leaves), so the operators are single vectorized reductions.
+    The results are still returned as NamedTree.'''
+
+    # with fewer samples a side, the resampled averages are too few to
+    # give a confidence interval worth the name
+    BOOTSTRAP_MIN_SAMPLES = 5
+
+    def __init__(self, T_list):
+        if numpy is None:
+            raise ImportError('numpy is needed by the columnar backend')
+        self.T_list = T_list
+        plan = NamedTree.compile_plan(*T_list)
+        self.paths = plan.paths
+        self.data = numpy.array(list(map(lambda T:T.leaf_values(plan), T_list)))
+
+    def to_tree(self, values, name):
+        T = NamedTree(name)
+        T.set_tree(named_tree_from_leaves(self.paths, values.tolist()))
+        return T
+
+    def _names(self):
+        return ' '.join(map(lambda T:T.name, self.T_list))
+
+    def sum(self):
+        return self.to_tree(self.data.sum(axis = 0),
+                            'the sum of %s' % self._names())
+
+    def average(self):
+        return self.to_tree(self.data.mean(axis = 0),
+                            'the average of %s' % self._names())
+
+    def diff_ratio(self):
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            ratio = (self.data[1] - self.data[0]) / self.data[0]
+        return self.to_tree(ratio, 'the diff ratio of %s' % self._names())
+
+    def diff_ratio_matrix(self):
+        ''' The diff ratios of all the pairs of trees at once, broadcast over
+        the leaves: r[i, j] is the one of the tree j against the tree i. '''
+        data = self.data.astype(float)
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            return (data[None, :, :] - data[:, None, :]) / data[:, None, :]
+
+    def select(self, pattern):
+        ''' The same trees over the leaves matching pattern (see
+        PathIndex.select); the data is a view, not a copy, when the leaves
+        are in one range. '''
+        index = path_index(self.paths)
+        spans = index.select(pattern)
+        sub = ColumnarGroup.__new__(ColumnarGroup)
+        sub.T_list = self.T_list
+        sub.paths = index.paths_in(spans)
+        if len(spans) == 1:
+            sub.data = self.data[:, spans[0][0]:spans[0][1]]
+        else:
+            sub.data = self.data[:, index.positions(spans)]
+        return sub
+
+    def change_points(self, threshold = 1.36, min_change = 0.1):
+        '''The most likely change point of every leaf, the trees being in
+        time order: the split maximizing the CUSUM |S_k| of the deviations
+        from the mean. Its score is |S_k| / (sigma * sqrt(n)), sigma from
+        the median of the successive differences so that the shift itself
+        does not inflate it; with no change the score is below 1.36 95% of
+        the time. All the leaves are done at once, there is no loop.
+        Return the trees before, after (the averages on both sides), change
+        (after / before - 1), score and since (the name of the first tree
+        after the change), only with the leaves whose score is above
+        threshold and whose change is more than min_change either way.'''
+        data = self.data.astype(float)
+        n = len(data)
+        names = list(map(lambda T:T.name, self.T_list))
+        if n < 3:
+            return list(map(lambda name:NamedTree(name, {}), ('before', 'after', 'change', 'score', 'since')))
+
+        total = data.sum(axis = 0)
+        # the sums of the first k + 1 trees, k = 0 .. n - 2
+        head = numpy.cumsum(data, axis = 0)[:-1]
+        size = numpy.arange(1, n)[:, None]
+        cusum = head - size * (total / n)
+        k = numpy.abs(cusum).argmax(axis = 0)[None, :]
+        peak = numpy.abs(numpy.take_along_axis(cusum, k, axis = 0))[0]
+        head = numpy.take_along_axis(head, k, axis = 0)[0]
+        k = k[0]
+        before = head / (k + 1)
+        after = (total - head) / (n - k - 1)
+        # median |x[i] - x[i-1]| is 0.9539 sigma for a normal noise
+        sigma = numpy.median(numpy.abs(numpy.diff(data, axis = 0)), axis = 0) / 0.9539
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            score = numpy.where(peak == 0, 0.0, peak / (sigma * math.sqrt(n)))
+            change = (after - before) / before
+        keep = numpy.flatnonzero((score > threshold) & (numpy.abs(change) > min_change))
+        log.debug('[ColumnarGroup] [Trend] %d change points in %d leaves of %d trees' %
+                  (len(keep), len(self.paths), n))
+
+        paths = list(map(lambda i:self.paths[i], keep.tolist()))
+        trees = []
+        for name, values in (('before', before[keep].tolist()), ('after', after[keep].tolist()),
+                             ('change', change[keep].tolist()), ('score', score[keep].tolist()),
+                             ('since', list(map(lambda i:names[i + 1], k[keep].tolist())))):
+            T = NamedTree(name)
+            T.set_tree(named_tree_from_leaves(paths, values))
+            trees.append(T)
+        return trees
+
+    def scale_multiply(self, scale):
+        return self.to_tree(self.data[0] * scale,
+                            'the product of %s' % self._names())
+
+    def bootstrap_diff_ratio(self, base, resamples = 10000, confidence = 0.95,
+                             seed = None, chunk_size = 1 << 22):
+        '''The percentile bootstrap confidence interval of the diff ratio of
+        the average of self against the average of base, for every leaf they
+        have in common. One set of resampling weights is drawn for each
+        group, and the resampled averages of a block of leaves are a single
+        matrix product, so there is no loop over the leaves.
+        Return the low and the high bound as NamedTree. ValueError if a
+        group has fewer than BOOTSTRAP_MIN_SAMPLES samples.'''
+        n = min(len(self.data), len(base.data))
+        if n < self.BOOTSTRAP_MIN_SAMPLES:
+            raise ValueError('the bootstrap needs %d samples a side, not %d' % (self.BOOTSTRAP_MIN_SAMPLES, n))
+        if self.paths == base.paths:
+            paths = self.paths
+            data_base, data_this = base.data, self.data
+        else:
+            index = dict(map(lambda p:(p[1], p[0]), enumerate(base.paths)))
+            common = list(filter(lambda i:self.paths[i] in index, range(len(self.paths))))
+            paths = list(map(lambda i:self.paths[i], common))
+            data_base = base.data[:, list(map(lambda i:index[self.paths[i]], common))]
+            data_this = self.data[:, common]
+        log.debug('[ColumnarGroup] [Bootstrap] %d leaves %d x %d samples %d resamples' %
+                  (len(paths), len(data_base), len(data_this), resamples))
+
+        rng = numpy.random.default_rng(seed)
+        def weights(n):
+            # row i is how often each sample is drawn by resample i
+            return rng.multinomial(n, numpy.full(n, 1.0 / n), size = resamples) / n
+        w_base = weights(len(data_base))
+        w_this = weights(len(data_this))
+
+        alpha = 1 - confidence
+        low = numpy.empty(len(paths))
+        high = numpy.empty(len(paths))
+        step = max(1, chunk_size // resamples)
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            for s in range(0, len(paths), step):
+                e = min(s + step, len(paths))
+                mean_base = w_base @ data_base[:, s:e]
+                ratio = (w_this @ data_this[:, s:e] - mean_base) / mean_base
+                low[s:e], high[s:e] = numpy.quantile(ratio, (alpha / 2, 1 - alpha / 2), axis = 0)
+
+        names = '%s against %s' % (self._names(), base._names())
+        T_low = NamedTree('the low bound of the diff ratio of %s' % names)
+        T_low.set_tree(named_tree_from_leaves(paths, low.tolist()))
+        T_high = NamedTree('the high bound of the diff ratio of %s' % names)
+        T_high.set_tree(named_tree_from_leaves(paths, high.tolist()))
+        return T_low, T_high
+
 # a decorator for NamedTreeGroup
 # some operations need to be done together to finish one job.
 def group_noreturn(kind = OP_KIND_LEAF):
     def real(func):
         def wrapper(group):
             T_list = group.T_list
-            data = {'T_list':T_list, 'user_data':group}
-            t_spec = NamedTree.extract_spec(*T_list)
+            evaluate_lazy(T_list)
+            plan = NamedTree.compile_plan(*T_list)
             t_list = list(map(lambda T:T.get_tree(), T_list))
-            named_tree_travel(func, t_spec, t_list, data, kind = kind)
+            plan.travel(func, t_list, group, kind = kind)
         return wrapper
     return real
 
 class NamedTreeGroup:
-    def __init__(self, *T_list):
+    ''' backend could be 'dict' (travel the nested dicts leaf by leaf)
+    or 'columnar' (see ColumnarGroup), the latter needs numpy. '''
+    def __init__(self, *T_list, backend = 'dict'):
+        # the pending results are computed together, when the values are
+        # first needed: only their shapes are needed here
         self.T_list = T_list
         self.t_spec = NamedTree.extract_spec(*T_list)
         for T in T_list:
             T.spec = self.t_spec
         self.name = ""
 
+        if backend == 'columnar' and numpy is None:
+            log.warning('[NamedTreeGroup] numpy is not found, use the dict backend')
+            backend = 'dict'
+        self.backend = backend
+        self._columnar = None
+
         self.leaf_render = self.__class__.LeafRender(self)
         #TODO path_render
 
     def __iter__(self):
         return iter(self.T_list)
 
+    def select(self, pattern):
+        ''' The group of the trees over the leaves matching pattern, see
+        NamedTree.select '''
+        evaluate_lazy(self.T_list)
+        return self.__class__(*map(lambda T:T.select(pattern), self.T_list), backend = self.backend)
+
+    def columnar(self):
+        if self._columnar is None:
+            evaluate_lazy(self.T_list)
+            self._columnar = ColumnarGroup(self.T_list)
+        return self._columnar
+
     def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self.backend == 'columnar' and hasattr(ColumnarGroup, name):
+            stageprofile.count('operators executed')
+            return getattr(self.columnar(), name)
         if hasattr(Operator, name):
             op = getattr(Operator, name)
+            evaluate_lazy(self.T_list)
             return lambda **user_data: op(*self.T_list, **user_data)
         else:
-            return AttributeError()
+            raise AttributeError(name)
 
     class LeafRender:
         def __init__(self, group):
@@ -401,8 +1390,10 @@ class NamedTreeGroup:
 
             self.header_width = {}
 
-            for T in group:
-                n = T.name
+            # the fields are the columns, named by _leaf_field_names, and
+            # the name of the tree of each
+            self.fields = OrderedDict(zip(group._leaf_field_names(), map(lambda T:T.name, group)))
+            for n in self.fields:
                 self.data_width[n] = 0
                 self.field_width[n] = 0
                 #self.field_width_fixed[n] = 0
@@ -414,8 +1405,6 @@ class NamedTreeGroup:
                 self.header_width[n] = 0
 
             self.delimiter = "    "
-            self.header_template = ""
-            self.row_template = ""
 
         def set_path_width(**width):
             for k in width:
@@ -430,17 +1419,23 @@ class NamedTreeGroup:
         def set_field_format_spec_start(self, **start):
             pass
 
+        def _set(self, attr, values):
+            ''' values by field name, or by tree name for all the fields
+            of the trees of that name '''
+            for n, name in self.fields.items():
+                if n in values:
+                    attr[n] = values[n]
+                elif name in values:
+                    attr[n] = values[name]
+
         def set_field_format_spec_end(self, **end):
-            for k in end:
-                self.field_format_spec_end[k] = end[k]
+            self._set(self.field_format_spec_end, end)
 
         def set_field_suffix(self, **suffix):
-            for k in suffix:
-                self.field_suffix[k] = suffix[k]
+            self._set(self.field_suffix, suffix)
 
         def merge_field_format_spec(self):
-            for T in self.group:
-                n = T.name
+            for n in self.fields:
                 if self.data_width[n] == 0:
                     spec = self.field_format_spec_start[n] + self.field_format_spec_end[n]
                 else:
@@ -451,8 +1446,7 @@ class NamedTreeGroup:
             self.delimiter = delimiter
 
         def set_header_width(self, **width):
-            for k in width:
-                self.header_width[k] = width[k]
+            self._set(self.header_width, width)
 
         def merge_width(self):
             tmp1 = self.path_width
@@ -460,8 +1454,7 @@ class NamedTreeGroup:
             tmp3 = max(tmp1, tmp2)
             self.path_width = tmp3
 
-            for T in self.group:
-                n = T.name
+            for n in self.fields:
                 tmp1 = self.data_width[n]
                 tmp1 += len(self.field_prefix[n]) + len(self.field_suffix[n])
                 #tmp2 = self.field_width_fixed[T.name]
@@ -469,107 +1462,230 @@ class NamedTreeGroup:
                 self.field_width[n] = tmp1
 
         def merge_header(self):
-            for T in self.group:
-                tmp1 = self.field_width[T.name]
-                tmp2 = self.header_width[T.name]
+            for n in self.fields:
+                tmp1 = self.field_width[n]
+                tmp2 = self.header_width[n]
                 tmp3 = max(tmp1, tmp2)
-                self.field_width[T.name] = tmp3
-                self.header_width[T.name] = tmp3
-
-        def create_template(self):
-            # first column
-            tmp_l = list()
-            tmp_l_h = list()
-
-            meta_tpl = '%s{%d:%d}%s'
-            tpl = meta_tpl % (self.path_prefix,
-                              0, #index
-                              self.path_width,
-                              self.path_suffix)
-
-            tmp_l.append(tpl)
-            tmp_l_h.append(tpl)
-            # data columns
-            i = 1
-            for T in self.group:
-                n = T.name
-                try:
-                    if len(self.field_format_spec) > 0:
-                        meta_tpl = '%s{%d:%s}%s'
-                        tpl = meta_tpl % (
-                            self.field_prefix[n],
-                            i,
-                            self.field_format_spec[n],
-                            self.field_suffix[n]
-                        )
-                    else:
-                        meta_tpl = '%s{%d}%s'
-                        tpl = meta_tpl % (
-                            self.field_prefix[n],
-                            i,
-                            self.field_suffix[n]
-                        )
-                    tmp_l.append(tpl)
-                    #header
-                    meta_tpl = '{%d:%d}'
-                    tpl = meta_tpl % (
-                        i,
-                        self.field_width[n]
-                    )
-                    tmp_l_h.append(tpl)
-                except Exception as error:
-                    log.error('tpl for field %d is %s',
-                              (i - 1, tpl))
-                    log.error('there should be only on %d in field_tpl')
-                    raise error
-                i += 1
-
-            self.row_template = self.delimiter.join(tmp_l)
-            self.header_template = self.delimiter.join(tmp_l_h)
-            print('[DEBUG] row_template %s' % self.row_template)
-            print('[DEBUG] header_template %s' % self.header_template)
-            
-
-    @group_noreturn(kind = OP_KIND_LEAF)
-    def _leaf_data_accum_width(path, k, t_list, self):
-        leaf_render = self.leaf_render
-        l = 0
-        for n in path:
-            l += len(str(n)) + 1
-        l += len(str(k))
-        leaf_render.path_width = max(l, leaf_render.path_width)
-
-        leaf_list = list(map(lambda t:t[k], t_list))
-        leaf_iter = iter(leaf_list)
+                self.field_width[n] = tmp3
+                self.header_width[n] = tmp3
+
+        def pad_column(self, n, values, cells):
+            ''' numbers are aligned to the right, strings to the left,
+            as format() does with a width '''
+            w = self.data_width[n]
+            prefix = self.field_prefix[n]
+            suffix = self.field_suffix[n]
+            return list(map(lambda v, c:prefix + (c.ljust(w) if isinstance(v, str) else c.rjust(w)) + suffix,
+                            values, cells))
+
+    def _leaf_columns(self):
+        ''' The leaf paths and the leaf values of every tree, in the same order '''
+        evaluate_lazy(self.T_list)
+        plan = NamedTree.compile_plan(*self.T_list)
+        return plan.paths, list(map(lambda T:T.leaf_values(plan), self.T_list))
+
+    def _leaf_rows(self):
+        ''' The leaf paths and the values of every tree at each of them, a
+        leaf at a time in the order of the plan, no column is built. The
+        pending results are computed at each leaf from their operands, as
+        evaluate_lazy does, and are not kept. '''
+        plan = NamedTree.compile_plan(*self.T_list)
+        nodes, sources = _lazy_nodes(self.T_list)
+        for T in self.T_list:
+            if not (isinstance(T, LazyTree) and T.pending()):
+                sources.setdefault(id(T), T)
+        S_list = list(sources.values())
+        # a row holds the values of the sources then the ones of the nodes at a leaf
+        index = dict(map(lambda p:(p[1], p[0]), enumerate(list(sources) + list(map(id, nodes)))))
+        steps = _lazy_steps(nodes, index)
+        wanted = list(map(lambda T:index[id(T)], self.T_list))
+        stageprofile.count('operators executed', len(nodes))
+        stageprofile.count('leaves traversed', len(plan.paths))
+
+        # the nested dicts are walked along the plan, the leaves kept in an
+        # array are looked up by position
+        columns = []
+        for S in S_list:
+            if S.tree is None and S.leaves is not None:
+                paths, values = S.leaves
+                columns.append((values, None if paths == plan.paths else path_index(paths).leaf))
+            else:
+                columns.append(None)
+        dicts = list(map(lambda S, c:S.get_tree() if c is None else None, S_list, columns))
+        n = len(S_list)
+        row = [None] * len(index)
+        stack = []
+        i = 0
+        for c in plan.code:
+            if c[0] == PLAN_ENTER:
+                stack.append(dicts)
+                dicts = list(map(lambda d:None if d is None else d[c[1]], dicts))
+                continue
+            if c[0] == PLAN_LEAVE:
+                dicts = stack.pop()
+                continue
+            k = c[1]
+            p = plan.paths[i]
+            for j in range(n):
+                if dicts[j] is not None:
+                    row[j] = dicts[j][k]
+                else:
+                    values, positions = columns[j]
+                    row[j] = values[i if positions is None else positions[p]]
+            j = n
+            for func, operands, cells, user_data in steps:
+                for cell, o in operands:
+                    cell[k] = row[o]
+                row[j] = func(c[2], k, cells, user_data)
+                j += 1
+            yield p, list(map(lambda o:row[o], wanted))
+            i += 1
+
+    def _leaf_field_names(self):
+        ''' The tree names, a repeated one gets its count appended '''
+        count = {}
+        names = []
         for T in self.T_list:
-            n = T.name
-            leaf = next(leaf_iter)
-            leaf_str = format(leaf, leaf_render.field_format_spec[n])
-            leaf_render.data_width[T.name] = max (
-                leaf_render.data_width[T.name],
-                len(leaf_str)
-            )
-
-    @group_noreturn(kind = OP_KIND_LEAF)
-    def _leaf_field_print(path, k, t_list, self):
-        fields = list(map(lambda t:t[k], t_list))
-        first = '/'.join(list(map(lambda d:str(d), path))) + '/' +str(k)
-        fields.insert(0, first)
-        print(self.leaf_render.row_template.format(*fields))
-
-    def _leaf_header_print(self):
-        headers = list(map(lambda T:T.name, self.T_list))
-        # place holder for the first column
-        headers.insert(0, '')
-        # TODO more details is needed
-        print(self.leaf_render.header_template.format(*headers))
-
-    def leaf_print(self):
-        self.leaf_render.merge_field_format_spec()
-        self._leaf_data_accum_width()
-        self.leaf_render.merge_width()
-        self.leaf_render.merge_header()
-        self.leaf_render.merge_field_format_spec()
-        self.leaf_render.create_template()
-        self._leaf_header_print()
-        self._leaf_field_print()
+            count[T.name] = count.get(T.name, 0) + 1
+            names.append(T.name if count[T.name] == 1 else '%s %d' % (T.name, count[T.name]))
+        return names
+
+    def _leaf_table(self, paths, columns, out):
+        leaf_render = self.leaf_render
+        leaf_render.merge_field_format_spec()
+        names = list(leaf_render.fields)
+
+        # every cell is formatted once, the widths are taken from the strings
+        path_cells = list(map(lambda p:'/'.join(map(str, p)), paths))
+        leaf_render.path_width = max([leaf_render.path_width] + list(map(len, path_cells)))
+        cells = []
+        for n, column in zip(names, columns):
+            spec = leaf_render.field_format_spec[n]
+            c = list(map(lambda v:format(v, spec), column))
+            leaf_render.data_width[n] = max([leaf_render.data_width[n]] + list(map(len, c)))
+            cells.append(c)
+        leaf_render.merge_width()
+        leaf_render.merge_header()
+        log.debug('[NamedTreeGroup] [Render] path width %d field width %s' %
+                  (leaf_render.path_width, leaf_render.field_width))
+
+        path_width = leaf_render.path_width
+        header = [''.ljust(path_width)]
+        # the header has the tree names, the fields are only keys
+        header.extend(map(lambda n:leaf_render.fields[n].ljust(leaf_render.field_width[n]), names))
+        table = [list(map(lambda c:c.ljust(path_width), path_cells))]
+        table.extend(map(leaf_render.pad_column, names, columns, cells))
+        lines = [leaf_render.delimiter.join(header)]
+        lines.extend(map(leaf_render.delimiter.join, zip(*table)))
+        out.write('\n'.join(lines) + '\n')
+
+    def _leaf_csv(self, rows, out):
+        writer = csv.writer(out)
+        writer.writerow(['path'] + self._leaf_field_names())
+        for p, row in rows:
+            writer.writerow(['/'.join(map(str, p))] + row)
+
+    def _leaf_json(self, rows, out):
+        names = self._leaf_field_names()
+        for p, row in rows:
+            record = OrderedDict(path = list(p))
+            # NaN and Infinity are not JSON
+            record.update(zip(names, map(lambda v:None if isinstance(v, float) and not math.isfinite(v) else v,
+                                         row)))
+            out.write(json.dumps(record) + '\n')
+
+    LEAF_FORMATS = ('table', 'csv', 'json')
+
+    def diff_ratio_summary(self, threshold = 0.1, lower_is_better = None):
+        ''' For every pair (base i, tree j): the geometric mean of the
+        ratios tree j / base i over the leaves minus 1, and the number of
+        leaves whose diff ratio is below -threshold and above threshold.
+        The leaves for which lower_is_better(path, k) is true, as for
+        regression_note, count the other way: base i / tree j.
+        All the pairs are one numpy computation, see diff_ratio_matrix. '''
+        if numpy is None:
+            raise ImportError('numpy is needed by the diff ratio matrix')
+        columnar = self.columnar()
+        ratio = columnar.diff_ratio_matrix()
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+            log_ratio = numpy.log1p(ratio)
+        if lower_is_better is not None:
+            lower = numpy.array(list(map(lambda p:bool(lower_is_better(p[:-1], p[-1])), columnar.paths)),
+                                dtype = bool)
+            ratio = numpy.where(lower, -ratio, ratio)
+            log_ratio = numpy.where(lower, -log_ratio, log_ratio)
+        # the leaves with a 0 or a negative value are left out of the mean
+        finite = numpy.isfinite(log_ratio)
+        geomean = numpy.expm1(numpy.where(finite, log_ratio, 0.0).sum(axis = 2) /
+                              numpy.maximum(finite.sum(axis = 2), 1))
+        regressed = (ratio < -threshold).sum(axis = 2)
+        improved = (ratio > threshold).sum(axis = 2)
+        return geomean, regressed, improved
+
+    def matrix_print(self, output_format = 'table', out = None, base = None, threshold = 0.1,
+                     lower_is_better = None):
+        ''' The diff_ratio_summary of all the pairs of trees, or of the
+        pairs against the tree named base. The table has a row per base
+        and a column per tree, csv and json have a record per pair. '''
+        if out is None:
+            out = sys.stdout
+        names = self._leaf_field_names()
+        geomean, regressed, improved = self.diff_ratio_summary(threshold, lower_is_better)
+        rows = range(len(names)) if base is None else [names.index(base)]
+        leaves = len(self.columnar().paths)
+
+        if output_format == 'table':
+            cells = []
+            for i in rows:
+                cells.append(list(map(lambda j:'-' if i == j else '%+.2f%% %d/%d' %
+                                      (geomean[i, j] * 100, regressed[i, j], improved[i, j]),
+                                      range(len(names)))))
+            first = [r'base \ this'] + list(map(lambda i:names[i], rows))
+            first_width = max(map(len, first))
+            widths = list(map(lambda j:max([len(names[j])] + list(map(lambda c:len(c[j]), cells))),
+                              range(len(names))))
+            lines = ['%d leaves, each cell: the geometric mean of the ratios, '
+                     'the leaves regressed / improved by more than %g%%' % (leaves, threshold * 100)]
+            lines.append(self.leaf_render.delimiter.join([first[0].ljust(first_width)] +
+                                                         list(map(lambda n, w:n.rjust(w), names, widths))))
+            for name, c in zip(first[1:], cells):
+                lines.append(self.leaf_render.delimiter.join([name.ljust(first_width)] +
+                                                             list(map(lambda v, w:v.rjust(w), c, widths))))
+            out.write('\n'.join(lines) + '\n')
+            return
+
+        fields = ('base', 'this', 'geomean', 'regressed', 'improved', 'leaves')
+        records = []
+        for i in rows:
+            for j in range(len(names)):
+                if i != j:
+                    records.append((names[i], names[j], float(geomean[i, j]),
+                                    int(regressed[i, j]), int(improved[i, j]), leaves))
+        if output_format == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(fields)
+            writer.writerows(records)
+        elif output_format == 'json':
+            for r in records:
+                out.write(json.dumps(OrderedDict(zip(fields, r))) + '\n')
+        else:
+            raise ValueError('unknown output format %s' % output_format)
+
+    def leaf_print(self, output_format = 'table', out = None):
+        ''' output_format: 'table' is aligned like the leaf_render says,
+        'csv' and 'json' (one object per leaf) are written row by row,
+        as the leaves are walked (see _leaf_rows), with the raw values
+        and no width pass. '''
+        if out is None:
+            out = sys.stdout
+        if output_format == 'table':
+            paths, columns = self._leaf_columns()
+            self._leaf_table(paths, columns, out)
+        elif output_format == 'csv':
+            self._leaf_csv(self._leaf_rows(), out)
+        elif output_format == 'json':
+            self._leaf_json(self._leaf_rows(), out)
+        else:
+            raise ValueError('unknown output format %s' % output_format)
+
+NamedTreeGroup.group_noreturn = group_noreturn
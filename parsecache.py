@@ -0,0 +1,106 @@
+''' A persistent cache of the parsed trees of the samples '''
+import os
+import zlib
+import pickle
+import hashlib
+import logging
+import tempfile
+
+log = logging.getLogger()
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'perf-log-analyse')
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+class ParseCache:
+    ''' One file per sample, named by the hash of the identity of the log
+    (real path, size, mtime) and of the parser (sample class, parse method,
+    its PARSE_VERSION), holding the zlib compressed pickle of the tree.
+    A changed log or parser just misses the cache. When the files take more
+    than max_size bytes, the least recently used ones are removed. '''
+
+    def __init__(self, dirname = DEFAULT_DIR, max_size = DEFAULT_MAX_SIZE, rebuild = False):
+        self.dirname = dirname
+        self.max_size = max_size
+        self.rebuild = rebuild
+        self.size = None
+        os.makedirs(dirname, exist_ok = True)
+
+    def _path(self, t, parse):
+        # the log of a sample read from an archive is identified by the archive
+        st = getattr(t, 'stat', None) or os.stat(getattr(t, 'archive', None) or t.filename)
+        cls = type(t)
+        ident = (os.path.realpath(t.filename), st.st_size, st.st_mtime_ns,
+                 cls.__qualname__, parse, getattr(cls, 'PARSE_VERSION', 0))
+        h = hashlib.sha1(repr(ident).encode()).hexdigest()
+        return os.path.join(self.dirname, h + '.tree')
+
+    def get(self, t, parse):
+        ''' The cached tree of the sample t, or None '''
+        if self.rebuild:
+            return None
+        try:
+            path = self._path(t, parse)
+            with open(path, 'rb') as f:
+                tree = pickle.loads(zlib.decompress(f.read()))
+            # the mtime of the cache files is the time they were last used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as error:
+            log.warning('[ParseCache] ignore the cache of %s: %s' % (t.filename, error))
+            return None
+        return tree
+
+    def put(self, t, parse, tree):
+        try:
+            path = self._path(t, parse)
+        except OSError:
+            return
+        data = zlib.compress(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL), 1)
+        fd, tmp = tempfile.mkstemp(dir = self.dirname, suffix = '.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if self.size is not None:
+            self.size += len(data)
+
+    def _files(self):
+        files = []
+        for e in os.scandir(self.dirname):
+            if e.name.endswith('.tree'):
+                st = e.stat()
+                files.append((st.st_mtime, st.st_size, e.path))
+        return files
+
+    def evict(self):
+        ''' Remove the least recently used files until the cache fits in max_size '''
+        if self.size is not None and self.size <= self.max_size:
+            return
+        files = self._files()
+        self.size = sum(map(lambda f:f[1], files))
+        if self.size <= self.max_size:
+            return
+        files.sort()
+        for mtime, size, path in files:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            if self.size <= self.max_size:
+                break
+
+def add_arguments(cmdlineparser):
+    cmdlineparser.add_argument('--cache-dir', default = DEFAULT_DIR,
+                               help = 'directory of the cache of the parsed logs')
+    cmdlineparser.add_argument('--cache-size', type = int, default = DEFAULT_MAX_SIZE // (1024 * 1024),
+                               help = 'size limit of the cache, in MB')
+    cmdlineparser.add_argument('--no-cache', action = 'store_true',
+                               help = 'neither read nor write the cache')
+    cmdlineparser.add_argument('--rebuild-cache', action = 'store_true',
+                               help = 'parse all the logs again and refresh the cache')
+
+def from_arguments(ns):
+    if ns.no_cache:
+        return None
+    return ParseCache(ns.cache_dir, ns.cache_size * 1024 * 1024, ns.rebuild_cache)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+''' One command line for all the tests: the run directories of each product
+are grouped by test name, and the runs of a test are parsed by the parser
+registered for it. A parser module is only imported when one of its runs
+is found, so a results tree of IOzone runs never loads statBonnie.
+
+    perfstat.py results/SLE11SP3 results/SLE12 --test 'qa_iozone_*'
+
+The average of each product is compared with the first one, test by test,
+in one table whose rows start with the test name.
+'''
+
+import sys
+import fnmatch
+import logging
+import argparse
+import importlib
+from namedtree import NamedTree, NamedTreeGroup
+import ctcs2
+import parsecache
+import stageprofile
+
+log = logging.getLogger()
+
+class Parser:
+    ''' The runs of the tests matching pattern (a glob) have a log named
+    log_name (the test name when None), loaded by sample_class of module
+    with its method named parse. value_spec formats the averages. '''
+
+    def __init__(self, pattern, module, sample_class, parse, log_name = None, value_spec = '.2f'):
+        self.pattern = pattern
+        self.module = module
+        self.sample_class = sample_class
+        self.parse = parse
+        self.log_name = log_name
+        self.value_spec = value_spec
+
+    def load(self):
+        ''' the sample class, its module is imported the first time '''
+        return getattr(importlib.import_module(self.module), self.sample_class)
+
+    def lower_is_better(self):
+        ''' the leaf names whose regression is an increase '''
+        return getattr(importlib.import_module(self.module), 'LOWER_IS_BETTER', ())
+
+    def samples(self, DB, test):
+        return DB.samples(test, self.log_name or test, self.load())
+
+REGISTRY = []
+
+def register(pattern, module, sample_class, parse, log_name = None, value_spec = '.2f'):
+    ''' Add a parser, the first registered one matching a test is used '''
+    REGISTRY.append(Parser(pattern, module, sample_class, parse, log_name, value_spec))
+
+register('qa_iozone_*', 'statIOzone', 'IOzoneSample', 'parse_mmap', value_spec = '.0f')
+register('bonnie-*', 'statBonnie', 'BonnieSample', 'parse')
+register('tiobench-*', 'statTiobench', 'TiobenchSample', 'parse', log_name = 'tiobench')
+
+def find_parser(test):
+    for p in REGISTRY:
+        if fnmatch.fnmatchcase(test, p.pattern):
+            return p
+    return None
+
+def log_filter(patterns):
+    ''' The logs kept by LogDB from an archive: the one of the parser of
+    each test matching patterns '''
+    def wanted(test, name):
+        if patterns and not any(map(lambda p:fnmatch.fnmatchcase(test, p), patterns)):
+            return False
+        parser = find_parser(test)
+        return parser is not None and name == (parser.log_name or test)
+    return wanted
+
+def find_tests(DB_list, patterns):
+    ''' The tests run by every product and their parsers, sorted by name '''
+    tests = None
+    for DB in DB_list:
+        found = set(DB.tests())
+        if patterns:
+            found = set(filter(lambda t:any(map(lambda p:fnmatch.fnmatchcase(t, p), patterns)), found))
+        if tests is not None and found != tests:
+            log.warning('[perfstat] only in some products: %s' % ' '.join(sorted(found ^ tests)))
+        tests = found if tests is None else tests & found
+    parsers = []
+    for test in sorted(tests or ()):
+        parser = find_parser(test)
+        if parser is None:
+            log.warning('[perfstat] no parser for %s' % test)
+            continue
+        parsers.append((test, parser))
+    return parsers
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'compare the runs of all the tests of products', prog = 'perfstat')
+    cmdlineparser.add_argument('db', nargs='+', help = 'a directory of runs, or a tar archive of run directories, per product; the first one is the base')
+    cmdlineparser.add_argument('--test', action = 'append', metavar = 'PATTERN',
+                               help = 'only the tests matching this glob, may be repeated')
+    cmdlineparser.add_argument('--list', action = 'store_true',
+                               help = 'only list the tests found and their parsers')
+    cmdlineparser.add_argument('--backend', choices = ('dict', 'columnar'),
+                               default = 'columnar',
+                               help = 'storage engine used to aggregate the samples')
+    cmdlineparser.add_argument('-j', '--jobs', type = int, default = 1,
+                               help = 'number of processes parsing the logs, 0 for one per cpu')
+    cmdlineparser.add_argument('--prefetch', type = int, default = 0, metavar = 'THREADS',
+                               help = 'stat and read ahead the logs THREADS at a time, for the logs on a network filesystem')
+    parsecache.add_arguments(cmdlineparser)
+    cmdlineparser.add_argument('--compact', action = 'store_true',
+                               help = 'keep the parsed samples in typed arrays to load many runs in less memory')
+    cmdlineparser.add_argument('--matrix', action = 'store_true',
+                               help = 'compare every pair of products over all their tests in one table, instead of leaf by leaf')
+    cmdlineparser.add_argument('--format', choices = NamedTreeGroup.LEAF_FORMATS, default = 'table',
+                               help = 'table for reading, csv or json (one object per line) for other tools')
+    stageprofile.add_arguments(cmdlineparser)
+
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+    cache = parsecache.from_arguments(ns)
+    stageprofile.from_arguments(ns)
+
+    DB_list = list(map(lambda db:ctcs2.LogDB(db, logs = log_filter(ns.test)), ns.db))
+    with stageprofile.stage('discovery'):
+        ctcs2.scan_archives(DB_list, ns.jobs)
+        parsers = find_tests(DB_list, ns.test)
+    if ns.list:
+        for test, parser in parsers:
+            print('%-32s %s.%s' % (test, parser.module, parser.sample_class))
+        return
+    if len(parsers) == 0:
+        log.warning('[perfstat] no test found in all of %s' % ' '.join(ns.db))
+        return
+
+    # the tree of each product, an average per test
+    product_trees = list(map(lambda DB:{}, DB_list))
+    lower_is_better = {}
+    for test, parser in parsers:
+        db_list = []
+        with stageprofile.stage('discovery'):
+            for DB in DB_list:
+                db_list.append(parser.samples(DB, test))
+        with stageprofile.stage('parsing'):
+            for db in db_list:
+                ctcs2.parse_samples(db, parser.parse, ns.jobs, cache, ns.compact, ns.prefetch)
+        with stageprofile.stage('aggregation'):
+            for db, trees in zip(db_list, product_trees):
+                trees[test] = NamedTreeGroup(*db, backend = ns.backend).average().get_tree()
+        lower_is_better[test] = parser.lower_is_better()
+
+    # the averages of all the tests in the same format, else the common one
+    value_spec = set(map(lambda e:e[1].value_spec, parsers))
+    value_spec = value_spec.pop() if len(value_spec) == 1 else '.2f'
+
+    average_list = list(map(lambda e:NamedTree(e[0].name, e[1]), zip(DB_list, product_trees)))
+    if ns.matrix:
+        with stageprofile.stage('comparison'):
+            ngroup = NamedTreeGroup(*average_list, backend = 'columnar')
+        with stageprofile.stage('rendering'):
+            ngroup.matrix_print(ns.format, lower_is_better = lambda path, k:k in lower_is_better.get(path[0], ()))
+        stageprofile.finish(ns)
+        return
+
+    a_iter = iter(average_list)
+    r_base = next(a_iter)
+    r_list = [r_base]
+    spec_end = {r_base.name:value_spec}
+    field_suffix = {}
+    for r_this in a_iter:
+        # computed in one walk by NamedTreeGroup below
+        # the Lat% of tiobench are often 0
+        r_diff_ratio = NamedTree.Operator.safe_diff_ratio(r_base, r_this, lazy = True)
+        r_diff_ratio_percent = NamedTree.Operator.scale_multiply(r_diff_ratio, scale = 100, lazy = True)
+        r_diff_ratio_percent.name = 'Fluctuation'
+        # the first level of the path is the test
+        r_diff_ratio_note = NamedTree.Operator.regression_note(r_diff_ratio, lazy = True,
+                                                               lower_is_better = lambda path, k:k in lower_is_better.get(path[0], ()))
+        r_diff_ratio_note.name = 'ratio_note'
+
+        spec_end[r_this.name] = value_spec
+        spec_end[r_diff_ratio_percent.name] = '.2f'
+        spec_end[r_diff_ratio_note.name] = 's'
+        field_suffix[r_diff_ratio_percent.name] = " %"
+        r_list.extend((r_this, r_diff_ratio_percent, r_diff_ratio_note))
+
+    with stageprofile.stage('comparison'):
+        ngroup = NamedTreeGroup(*r_list)
+    ngroup.leaf_render.set_field_format_spec_end(**spec_end)
+    ngroup.leaf_render.set_field_suffix(**field_suffix)
+    with stageprofile.stage('rendering'):
+        ngroup.leaf_print(ns.format)
+    stageprofile.finish(ns)
+
+if __name__ == '__main__':
+    main()
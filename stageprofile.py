@@ -0,0 +1,187 @@
+''' Wall time and memory of the stages of a run, and counters.
+
+The stages and counters go to the current profile, which is a no-op one
+until enable() is called, so the instrumented code only pays a function
+call per stage or per counted item when profiling is off:
+
+    with stageprofile.stage('parsing'):
+        ...
+    stageprofile.count('files discovered', len(db))
+
+A stage inside another one is named after both, like 'aggregation/spec'.
+The counters of the worker processes of ctcs2.iter_parsed (-j) are lost,
+the ones counted by ctcs2 itself are not.
+'''
+import io
+import sys
+import json
+import time
+import resource
+from collections import OrderedDict
+
+CAPTURES = ('cprofile', 'tracemalloc')
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class NullProfile:
+    ''' What is used when profiling is off '''
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def count(self, name, n = 1):
+        pass
+
+class _Stage:
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        p = self.profile
+        p._stack.append(self.name)
+        self.path = '/'.join(p._stack)
+        # a stage is listed before the ones inside it
+        p.stages.setdefault(self.path, {'wall': 0.0, 'calls': 0, 'peak_kb': 0})
+        self.top = len(p._stack) == 1
+        self.capture = None
+        if self.top and p.capture == 'cprofile':
+            import cProfile
+            self.capture = cProfile.Profile()
+            self.capture.enable()
+        elif self.top and p.capture == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        p = self.profile
+        wall = time.perf_counter() - self.start
+        if self.capture:
+            self.capture.disable()
+        s = p.stages[self.path]
+        s['wall'] += wall
+        s['calls'] += 1
+        if p.capture == 'tracemalloc':
+            import tracemalloc
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+        else:
+            # the peak of the process so far, in KB on Linux
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        s['peak_kb'] = max(s['peak_kb'], peak)
+        if self.top and p.capture == 'cprofile':
+            p._captures.setdefault(self.path, []).append(self.capture)
+        elif self.top and p.capture == 'tracemalloc':
+            p._captures[self.path] = tracemalloc.take_snapshot()
+        p._stack.pop()
+        return False
+
+class StageProfile:
+    ''' capture: None, 'cprofile' (each top stage is profiled, the hottest
+    one is shown) or 'tracemalloc' (the peak of each top stage is traced,
+    the allocations of the hottest one are shown) '''
+    enabled = True
+
+    def __init__(self, capture = None):
+        self.capture = capture
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self._stack = []
+        self._captures = {}
+        if capture == 'tracemalloc':
+            # like cProfile and pstats, only imported when used
+            import tracemalloc
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {'stages': self.stages, 'counters': self.counters}
+
+    def hottest(self):
+        top = list(filter(lambda s:'/' not in s, self.stages))
+        if len(top) == 0:
+            return None
+        return max(top, key = lambda s:self.stages[s]['wall'])
+
+    def report(self, out = None):
+        if out is None:
+            out = sys.stderr
+        lines = ['%-32s %10s %12s %6s' % ('stage', 'wall ms',
+                                          'peak KB' if self.capture == 'tracemalloc' else 'max rss KB',
+                                          'calls')]
+        for name, s in self.stages.items():
+            lines.append('%-32s %10.1f %12d %6d' % (name, s['wall'] * 1000, s['peak_kb'], s['calls']))
+        lines.append('')
+        lines.append('%-32s %10s' % ('counter', 'value'))
+        for name, v in self.counters.items():
+            lines.append('%-32s %10d' % (name, v))
+
+        hottest = self.hottest()
+        if hottest in self._captures:
+            lines.append('')
+            lines.append('the hottest stage: %s' % hottest)
+            if self.capture == 'cprofile':
+                import pstats
+                buf = io.StringIO()
+                stats = pstats.Stats(*self._captures[hottest], stream = buf)
+                stats.sort_stats('cumulative').print_stats(20)
+                lines.append(buf.getvalue())
+            else:
+                for stat in self._captures[hottest].statistics('lineno')[:20]:
+                    lines.append(str(stat))
+        out.write('\n'.join(lines) + '\n')
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent = 2)
+
+current = NullProfile()
+
+def enable(capture = None):
+    global current
+    current = StageProfile(capture)
+    return current
+
+def enabled():
+    return current.enabled
+
+def stage(name):
+    return current.stage(name)
+
+def count(name, n = 1):
+    current.count(name, n)
+
+def add_arguments(cmdlineparser):
+    cmdlineparser.add_argument('--profile', action = 'store_true',
+                               help = 'show the time and memory of each stage and the counters on stderr')
+    cmdlineparser.add_argument('--profile-json', metavar = 'FILE',
+                               help = 'write the stages and the counters to FILE as JSON')
+    cmdlineparser.add_argument('--profile-capture', choices = CAPTURES,
+                               help = 'also show the cProfile or tracemalloc capture of the hottest stage')
+
+def from_arguments(ns):
+    if ns.profile or ns.profile_json or ns.profile_capture:
+        return enable(ns.profile_capture)
+    return None
+
+def finish(ns):
+    ''' report the profile enabled by from_arguments(ns), if any '''
+    if not current.enabled:
+        return
+    if ns.profile or ns.profile_capture:
+        current.report()
+    if ns.profile_json:
+        current.dump(ns.profile_json)
@@ -6,14 +6,18 @@ import re
 import math
 import logging
 import argparse
-from xml.dom.minidom import parseString
-from namedtree import NamedTree, NamedTreeGroup, OP_KIND_LEAF, OP_KIND_DIR
+from namedtree import NamedTree, NamedTreeGroup, ColumnarGroup, OP_KIND_LEAF, OP_KIND_DIR, numpy
+import ctcs2
+import parsecache
+import stageprofile
 
 
 log = logging.getLogger()
 
 IO_PATTERN = ('putc', 'write', 'read_wirte', 'getc', 'read')
 IO_MEASURE = ('kB/s', '%CPU')
+# a regression of these is an increase
+LOWER_IS_BETTER = ('%CPU',)
 PR_FORMAT = {'kB/s': '{0:%ds}\t{1:>%d.0f}\t{2:>%d.0f}\t{3:>%d.2f}',
              '%CPU': '{0:%ds}\t{1:>%d.2f}\t{2:>%d.2f}\t{3:>%d.2f}%%'}
 
@@ -28,7 +32,17 @@ class PaintUnit:
         return str(self.obj)
 
 PST_NULL, PST_ERROR, PST_START, PST_END, PST_ONERUN, PST_ONETABLE = range(6)
+RUN_PT = re.compile(r'^Needing\s*(\d*)\s*MB')
+TR_PT = re.compile(r'^<TR>(<TD>[^<>]*</TD>)+</TR>\s*$')
+TD_PT = re.compile(r'<TD>([^<>]*)</TD>')
+SIZE_PT = re.compile(r'\s*(\d+)\s*\*\s*(\d+)')
+
 class BonnieSample(NamedTree):
+    # to be increased when the tree parsed from a log changes
+    PARSE_VERSION = 2
+    # False to parse every row with xml.dom.minidom
+    FAST_PARSE = True
+    __slots__ = ctcs2.SAMPLE_SLOTS + ('parse_ST',)
 
     def __init__(self, filename, name = None):
         self.filename = filename
@@ -46,11 +60,11 @@ class BonnieSample(NamedTree):
         self.fd = None
         self.parse_ST = PST_NULL
 
-    def _pas_TD(self, tds):
+    def _pas_cells(self, cells):
         ''' No error check '''
-        #tds[0].firstChild.data #hostname
+        #cells[0] #hostname
         # condition
-        fr = re.match(r'(\d+)\s*\*\s*(\d+)', tds[1].firstChild.data)
+        fr = SIZE_PT.match(cells[1])
         fsize = int(fr.group(1))
         iocount = int(fr.group(2))
 
@@ -58,8 +72,9 @@ class BonnieSample(NamedTree):
         i = 2
         for ptn in IO_PATTERN:
             result_tree = {}
-            result_tree[IO_MEASURE[0]] = int(tds[i].firstChild.data)
-            result_tree[IO_MEASURE[1]] = float(tds[i + 1].firstChild.data)
+            result_tree[IO_MEASURE[0]] = int(cells[i])
+            result_tree[IO_MEASURE[1]] = float(cells[i + 1])
+            i += 2
             ptn_tree = self.tree[ptn]
             if fsize in ptn_tree:
                 fsize_tree = ptn_tree[fsize]
@@ -73,29 +88,54 @@ class BonnieSample(NamedTree):
                 iocount_tree = result_tree
                 fsize_tree[iocount] = iocount_tree
 
+    def _pas_TD(self, tds):
+        self._pas_cells(list(map(lambda td:td.firstChild.data, tds)))
+
+    def _pas_TR_dom(self, line):
+        ''' The slow path, for the rows the tokenizer does not understand '''
+        from xml.dom.minidom import parseString
+        domt = parseString(line)
+        tr = domt.firstChild
+        self._pas_TD(tr.childNodes)
+
+    def _pas_TR_fast(self, line):
+        ''' Read the cells straight from the line, no DOM.
+        Return False if the row does not look like a bonnie result row. '''
+        if not TR_PT.match(line):
+            return False
+        cells = TD_PT.findall(line)
+        if len(cells) < 2 + 2 * len(IO_PATTERN) or not SIZE_PT.match(cells[1]):
+            return False
+        try:
+            # all the numbers are converted before the tree is touched
+            list(map(float, cells[2:2 + 2 * len(IO_PATTERN)]))
+        except ValueError:
+            return False
+        self._pas_cells(cells)
+        return True
+
     def _pas_TR(self):
         for line in self.fd:
-            if re.match(r'^<TR><TD>', line):
-                self.parse_ST == PST_ONETABLE
-                try:
-                    domt = parseString(line)
-                    tr = domt.firstChild
-                    nt = self._pas_TD(tr.childNodes)
-                except Exception as a:
-                    raise a
+            stageprofile.count('lines scanned')
+            if line.startswith('<TR><TD>'):
+                stageprofile.count('lines matched')
+                self.parse_ST = PST_ONETABLE
+                if not (self.FAST_PARSE and self._pas_TR_fast(line)):
+                    self._pas_TR_dom(line)
                 return
         self.parse_ST = PST_ERROR
 
     def _pas_RUN(self):
         for line in self.fd:
-            if re.match(r'^Needing\s*(\d*)\s*MB', line):
+            stageprofile.count('lines scanned')
+            if RUN_PT.match(line):
                 self.parse_ST = PST_ONERUN
                 return
         self.parse_ST = PST_END
 
     def parse(self):
         if self.parse_ST == PST_NULL:
-            self.fd = open(self.filename)
+            self.fd = ctcs2.open_log(self)
             self.parse_ST = PST_START
 
         if self.parse_ST == PST_START:
@@ -109,21 +149,10 @@ class BonnieSample(NamedTree):
             if self.parse_ST == PST_ERROR:
                 self.parse_ST = PST_END
 
-def get_samples_in_dir(dirname):
-    pattern = re.compile('bonnie-directIO-(\d{4}-\d{2}-\d{2})-(\d{2})-(\d{2})-(\d{2})')
-    db = []
-    for name in os.listdir(dirname):
-        r = pattern.match(name)
-        if r:
-            sample_name = "%sT%s:%s:%s" % (r.group(1), r.group(2),
-                                           r.group(3), r.group(4))
-            filename = dirname + '/' + name + '/' + 'bonnie-directIO'
-            db.append(BonnieSample(filename, sample_name))
-    return db
-
 class BonnieSampleGroup(NamedTreeGroup):
     def __init__(self, *T_list):
         super().__init__(*T_list)
+        self.width = {'path': 0}
         for k in IO_MEASURE:
             self.width[k] = [0, 0, 6]
         self.width['%CPU'] = [7, 7, 6]
@@ -183,51 +212,123 @@ class BonnieSampleGroup(NamedTreeGroup):
         sys.stdout.write(self.tplt['kB/s'].format(*kb_s))
         cpu_p = list(map(lambda t:t['%CPU'], t_list))
         sys.stdout.write(self.tplt['%CPU'].format(*cpu_p))
-        if cpu_p[2] < -0.15:
+        # the 4th tree, if any, is the high bound of the bootstrap interval
+        if len(cpu_p) > 3:
+            regression = cpu_p[3] < 0
+        else:
+            regression = cpu_p[2] < -0.15
+        if regression:
             print('\t***')
         else:
             print()
 
+def matrix(ns, cache):
+    ''' Each directory is averaged once, then all the pairs are compared at once '''
+    DB_list = list(map(lambda db:ctcs2.LogDB(db, logs = ('bonnie-directIO',)), ns.db))
+    average_list = []
+    with stageprofile.stage('discovery'):
+        ctcs2.scan_archives(DB_list, ns.jobs)
+        db_list = list(map(lambda DB:DB.samples('bonnie-directIO', 'bonnie-directIO', BonnieSample), DB_list))
+    for DB, db in zip(DB_list, db_list):
+        if len(db) == 0:
+            log.warning('[Bonnie] There is no log files from %s' % DB.log_dir)
+            continue
+        with stageprofile.stage('parsing'):
+            ctcs2.parse_samples(db, 'parse', ns.jobs, cache, prefetch = ns.prefetch)
+        with stageprofile.stage('aggregation'):
+            average = NamedTreeGroup(*db, backend = ns.backend).average()
+        average.name = DB.name
+        average_list.append(average)
+    if len(average_list) < 2:
+        return
+    with stageprofile.stage('comparison'):
+        ngroup = NamedTreeGroup(*average_list, backend = 'columnar')
+    with stageprofile.stage('rendering'):
+        ngroup.matrix_print(ns.format, lower_is_better = lambda path, k:k in LOWER_IS_BETTER)
+
 def main():
     cmdlineparser = argparse.ArgumentParser(description = 'BonnieSample Parser', prog = 'BonnieSample')
-    cmdlineparser.add_argument('db', nargs='+')
+    cmdlineparser.add_argument('db', nargs='+', help = 'two directories of runs, or tar archives of run directories')
+    cmdlineparser.add_argument('--backend', choices = ('dict', 'columnar'),
+                               default = 'columnar',
+                               help = 'storage engine used to aggregate the samples')
+    cmdlineparser.add_argument('-j', '--jobs', type = int, default = 1,
+                               help = 'number of processes parsing the logs, 0 for one per cpu')
+    cmdlineparser.add_argument('--prefetch', type = int, default = 0, metavar = 'THREADS',
+                               help = 'stat and read ahead the logs THREADS at a time, for the logs on a network filesystem')
+    parsecache.add_arguments(cmdlineparser)
+    cmdlineparser.add_argument('--bootstrap', type = int, default = 0, metavar = 'N',
+                               help = 'flag only the %%CPU regressions whose bootstrap confidence interval of N resamples is below 0, if both directories have 5 samples or more')
+    cmdlineparser.add_argument('--confidence', type = float, default = 0.95,
+                               help = 'confidence level of the bootstrap interval')
+    cmdlineparser.add_argument('--seed', type = int, help = 'seed of the bootstrap resampling')
+    cmdlineparser.add_argument('--matrix', action = 'store_true',
+                               help = 'compare every pair of any number of directories in one table')
+    cmdlineparser.add_argument('--format', choices = NamedTreeGroup.LEAF_FORMATS, default = 'table',
+                               help = 'the format of --matrix')
+    stageprofile.add_arguments(cmdlineparser)
 
     ns = cmdlineparser.parse_args(sys.argv[1:])
+    cache = parsecache.from_arguments(ns)
+    stageprofile.from_arguments(ns)
+    if ns.matrix:
+        if numpy is None:
+            cmdlineparser.error('--matrix needs numpy')
+        matrix(ns, cache)
+        stageprofile.finish(ns)
+        return
     if len(ns.db) != 2:
         print('Usages')
+    if ns.bootstrap and numpy is None:
+        cmdlineparser.error('--bootstrap needs numpy')
 
-    db0 = get_samples_in_dir(ns.db[0])
-    db1 = get_samples_in_dir(ns.db[1])
-
-    for t in db0:
-        t.parse()
+    with stageprofile.stage('discovery'):
+        DB0, DB1 = map(lambda db:ctcs2.LogDB(db, logs = ('bonnie-directIO',)), ns.db[0:2])
+        ctcs2.scan_archives((DB0, DB1), ns.jobs)
+        db0 = DB0.samples('bonnie-directIO', 'bonnie-directIO', BonnieSample)
+        db1 = DB1.samples('bonnie-directIO', 'bonnie-directIO', BonnieSample)
 
-    for t in db1:
-        t.parse()
+    with stageprofile.stage('parsing'):
+        ctcs2.parse_samples(db0, 'parse', ns.jobs, cache, prefetch = ns.prefetch)
+        ctcs2.parse_samples(db1, 'parse', ns.jobs, cache, prefetch = ns.prefetch)
 
     #print(type(NamedTree.operator.average))
 
-    #average0 = NamedTree.operator.average(*db0)
-    #average0.set_name(os.path.basename(ns.db[0]))
-    group0 = NamedTreeGroup(*db0)
-    average0 = group0.average()
-    average0.name = os.path.basename(ns.db[0])
-    #average1 = NamedTree.operator.average(*db1)
-    #average1.set_name(os.path.basename(ns.db[1]))
-    group1 = NamedTreeGroup(*db1)
-    average1 = group1.average()
-    average1.name = os.path.basename(ns.db[1])
+    with stageprofile.stage('aggregation'):
+        #average0 = NamedTree.operator.average(*db0)
+        #average0.set_name(os.path.basename(ns.db[0]))
+        group0 = NamedTreeGroup(*db0, backend = ns.backend)
+        average0 = group0.average()
+        average0.name = DB0.name
+        #average1 = NamedTree.operator.average(*db1)
+        #average1.set_name(os.path.basename(ns.db[1]))
+        group1 = NamedTreeGroup(*db1, backend = ns.backend)
+        average1 = group1.average()
+        average1.name = DB1.name
 
-    diff_ratio = NamedTree.Operator.diff_ratio(average0, average1)
+    with stageprofile.stage('comparison'):
+        diff_ratio = NamedTree.Operator.diff_ratio(average0, average1)
 
 
     #union = NamedTree.operator.union(average0, average1, diff_ratio)
     #NamedTree.painter.single(union)
 
-    ngroup = BonnieSampleGroup(average0, average1, diff_ratio)
+    r_list = [average0, average1, diff_ratio]
+    if ns.bootstrap and min(len(db0), len(db1)) < ColumnarGroup.BOOTSTRAP_MIN_SAMPLES:
+        log.warning('[Bonnie] one of the directories has fewer than %d samples, use the 15%% threshold' %
+                    ColumnarGroup.BOOTSTRAP_MIN_SAMPLES)
+    elif ns.bootstrap:
+        with stageprofile.stage('bootstrap'):
+            r_low, r_high = group1.columnar().bootstrap_diff_ratio(group0.columnar(),
+                                                                   ns.bootstrap, ns.confidence, ns.seed)
+        r_list.append(r_high)
+
+    ngroup = BonnieSampleGroup(*r_list)
     #ngroup.painter = NamedTreePainter(info)
 
-    ngroup.pnt_result()
+    with stageprofile.stage('rendering'):
+        ngroup.pnt_result()
+    stageprofile.finish(ns)
 
 if __name__ == '__main__':
     main()
@@ -4,10 +4,16 @@ import sys
 import os
 import re
 import math
+import mmap
+import time
 import logging
 import argparse
-from namedtree import NamedTree, NamedTreeGroup, OP_KIND_LEAF, OP_KIND_DIR
+from collections import OrderedDict
+from namedtree import NamedTree, NamedTreeGroup, ColumnarGroup, StreamingStats, OP_KIND_LEAF, OP_KIND_DIR, numpy
+from namedtree import save_stats, load_stats, parse_path_pattern
 import ctcs2
+import parsecache
+import stageprofile
 
 log = logging.getLogger()
 
@@ -15,8 +21,20 @@ IO_PATTERN = ('write', 'rewrite', 'read', 'reread', 'random read', 'random write
               'bkwd read', 'record rewirte', 'stride read', 'fwrite', 'frewrite',
               'fread', 'freread')
 
+HEADER_PT = re.compile(r'^\s*KB\s+reclen')
+RECORD_PT = re.compile(r'^\s*\d+\s+\d+(\s+\d+)+')
+# the same, on the raw bytes: the header line, and the first line after
+# the block of records (empty or not starting with a number)
+HEADER_BPT = re.compile(rb'^[ \t]*KB[ \t]+reclen.*\n', re.M)
+BLOCK_END_BPT = re.compile(rb'\n[ \t]*(?:[^\d \t]|\n|$)')
+# a line of records after the block, which parse_default takes too
+RECORD_BPT = re.compile(rb'^[ \t]*\d+[ \t]+\d+(?:[ \t]+\d+)+.*$', re.M)
+
 PST_NULL, PST_ERROR, PST_START, PST_RECORD, PST_END = range(5)
 class IOzoneSample(NamedTree):
+    # to be increased when the tree parsed from a log changes
+    PARSE_VERSION = 2
+    __slots__ = ctcs2.SAMPLE_SLOTS + ('parse_ST', '_records')
 
     def __init__(self, filename, name = None):
         self.filename = filename
@@ -30,12 +48,25 @@ class IOzoneSample(NamedTree):
 
         self.fd = None
         self.parse_ST = PST_NULL
+        # filled by parse_mmap: the (record, KB reclen IO_PATTERN) array
+        # of the records, -1 for no result, until get_tree() is called
+        self._records = None
+
+    def get_tree(self):
+        if self._records is not None:
+            self._tree_view()
+        return super().get_tree()
+
+    def set_tree(self, tree):
+        super().set_tree(tree)
+        self._records = None
 
     def record(self, line):
         results = line.split()
         results_iter = iter(results)
         KB = int(next(results_iter))     #0
         reclen = int(next(results_iter)) #1
+        stageprofile.count('lines matched')
 
         for pt in IO_PATTERN:
             pt_tree = self.tree[pt]
@@ -47,83 +78,197 @@ class IOzoneSample(NamedTree):
                 if reclen not in KB_tree:
                     KB_tree[reclen] = int(result) #except?
                 else:
-                    log.waring('[IOzoneSample] duplicate result %s %s %s %s' % (pt, KB, reclen, result))
+                    log.warning('[IOzoneSample] duplicate result %s %s %s %s' % (pt, KB, reclen, result))
             except StopIteration:
                 log.warning('[IOzoneSample] the result has less data than needed')
                 break
 
     def parse_default(self):
         if self.parse_ST == PST_NULL:
-            self.fd = open(self.filename)
+            self.fd = ctcs2.open_log(self)
             for pt in IO_PATTERN:
                 self.tree[pt] = dict()
             self.parse_ST = PST_START
 
         if self.parse_ST == PST_START:
             for line in self.fd:
-                if re.match('^\s*KB\s+reclen', line):
+                stageprofile.count('lines scanned')
+                if HEADER_PT.match(line):
                     log.debug('[IOzoneSample] [parse_default] find KB reclen line')
                     self.parse_ST = PST_RECORD
                     break
 
         if self.parse_ST == PST_RECORD:
-            record_pt = re.compile('^\s*\d+\s+\d+(\s+\d+)+')
             for line in self.fd:
-                if record_pt.match(line):
-                    log.debug('[IOzoneSample] [parse_default] find a record %s' % line)
+                stageprofile.count('lines scanned')
+                if RECORD_PT.match(line):
+                    log.debug('[IOzoneSample] [parse_default] find a record %s', line)
                     self.record(line)
                 else:
                     self.parse_ST = PST_END
 
+    def parse_mmap(self):
+        ''' Same result as parse_default, but the file is mapped, the search
+        jumps to the KB reclen header and the whole block of records is
+        converted at once into an array; the records after the block, if
+        any, are looked for like parse_default does. The tree is only
+        built from the array, in the order of the log, when get_tree() is
+        called. '''
+        if numpy is None:
+            return self.parse_default()
 
-def main():
-    cmdlineparser = argparse.ArgumentParser(description = 'Sample Parser', prog = 'Sample')
-    cmdlineparser.add_argument('db', nargs='+')
+        if getattr(self, 'content', None) is not None:
+            # read from an archive or read ahead, nothing to map
+            with ctcs2.open_log(self, binary = True) as f:
+                records = self._parse_block(f.read())
+        else:
+            records = self._parse_mapped()
 
-    #TODO a universal command line
+        for pt in IO_PATTERN:
+            self.tree[pt] = dict()
+        self.parse_ST = PST_END
+        if records is None:
+            return
 
-    ns = cmdlineparser.parse_args(sys.argv[1:])
-    if len(ns.db) < 0:
-        print('Usages')
-        exit()
+        stageprofile.count('lines matched', len(records))
+        self._records = records
 
-    average_list = []
+    def _parse_mapped(self):
+        with open(self.filename, 'rb') as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                buf = b''
+            stageprofile.count('bytes read', len(buf))
+            try:
+                return self._parse_block(buf)
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
 
-    for db in ns.db:
-        DB = ctcs2.LogDB(db)
-        db = DB.samples('qa_iozone_4-32G', 'qa_iozone_4-32G', IOzoneSample)
-        if len(db) == 0:
-            log.warning('[IOzone] There is no log files from %s' % ns.db[0])
-            continue
-        for t in db:
-            t.parse_default()
-        group = NamedTreeGroup(*db)
-        average = group.average()
-        average.name = DB.name
-        average_list.append(average)
+    def _parse_block(self, buf):
+        r = HEADER_BPT.search(buf)
+        if not r:
+            return None
+        log.debug('[IOzoneSample] [parse_mmap] find KB reclen line')
+        start = r.end()
+        r = BLOCK_END_BPT.search(buf, start - 1)
+        end = r.start() + 1 if r else len(buf)
+        block = buf[start:end]
+        lines = block.splitlines()
+        # the records after the block, one line at a time
+        more = RECORD_BPT.findall(buf, end)
+        stageprofile.count('lines scanned', len(lines) + len(more))
+        width = 2 + len(IO_PATTERN)
+        try:
+            values = block.split()
+            if len(values) == len(lines) * width and not more:
+                return numpy.array(values, dtype = numpy.int64).reshape(len(lines), width)
+
+            # some records are short, pad them with -1
+            lines.extend(more)
+            records = numpy.full((len(lines), width), -1, dtype = numpy.int64)
+            for i, line in enumerate(lines):
+                row = line.split()[:width]
+                if len(row) < width:
+                    log.warning('[IOzoneSample] the result has less data than needed')
+                records[i, :len(row)] = numpy.array(row, dtype = numpy.int64)
+            return records
+        except ValueError:
+            # not only numbers, this is not a block of records
+            log.warning('[IOzoneSample] [parse_mmap] unexpected records in %s' % self.filename)
+            return None
+
+    def _tree_view(self):
+        records = self._records
+        self._records = None
+        for row in records.tolist():
+            KB, reclen = row[0], row[1]
+            for pt, result in zip(IO_PATTERN, row[2:]):
+                if result < 0:
+                    break
+                KB_tree = self.tree[pt].setdefault(KB, {})
+                if reclen not in KB_tree:
+                    KB_tree[reclen] = result
+                else:
+                    log.warning('[IOzoneSample] duplicate result %s %s %s %s' % (pt, KB, reclen, result))
+
+
+def print_meta_diff(average_list, meta_list):
+    base = average_list[0].name
+    for average, meta in zip(average_list[1:], meta_list[1:]):
+        d = meta_list[0].diff(meta)
+        print('%s -> %s' % (base, average.name))
+        print('  kernel %s -> %s' % d['kernel'])
+        print('  packages: %d changed, %d added, %d removed' %
+              (len(d['changed']), len(d['added']), len(d['removed'])))
+        for p in d['changed']:
+            print('  ~ %s %s -> %s' % p)
+        for p in d['added']:
+            print('  + %s %s' % p)
+        for p in d['removed']:
+            print('  - %s %s' % p)
+        print()
 
+def print_comparison(average_list, extra_list, group_list, ns):
+    ''' The averages against the first one, the extra columns of each
+    directory after its average and, with ns.bootstrap, the confidence
+    interval computed from group_list '''
     def note_over_10_percent (v_list):
         if v_list[0] < -0.1:
             return '***'
         else:
             return '   '
 
+    def note_significant (v_list):
+        # the high bound of the interval
+        if v_list[0] < 0:
+            return '***'
+        else:
+            return '   '
+
     a_iter = iter(average_list)
+    e_iter = iter(extra_list)
+    g_iter = iter(group_list)
+    g_base = next(g_iter, None)
     r_base = next(a_iter)
     r_list = list()
     r_list.append(r_base)
     spec_end = {r_base.name:'.0f'}
     field_suffix = {}
+    for r_extra in next(e_iter):
+        spec_end[r_extra.name] = '.0f'
+        r_list.append(r_extra)
     while True:
         try:
             r_this = next(a_iter)
         except StopIteration:
             break
         else:
-            r_diff_ratio = NamedTree.Operator.diff_ratio(r_base, r_this)
-            r_diff_ratio_percent = NamedTree.Operator.scale_multiply(r_diff_ratio, scale = 100)
+            # computed in one walk by NamedTreeGroup below
+            r_diff_ratio = NamedTree.Operator.diff_ratio(r_base, r_this, lazy = True)
+            r_diff_ratio_percent = NamedTree.Operator.scale_multiply(r_diff_ratio, scale = 100, lazy = True)
             r_diff_ratio_percent.name = 'Fluctuation'
-            r_diff_ratio_note = NamedTree.Operator.user_defined(r_diff_ratio, cb_func = note_over_10_percent)
+            r_ci_list = []
+            g_this = next(g_iter, None)
+            if ns.bootstrap and min(len(g_base.T_list), len(g_this.T_list)) < ColumnarGroup.BOOTSTRAP_MIN_SAMPLES:
+                log.warning('[IOzone] %s or %s has fewer than %d samples, use the 10%% threshold' %
+                            (r_base.name, r_this.name, ColumnarGroup.BOOTSTRAP_MIN_SAMPLES))
+            elif ns.bootstrap:
+                with stageprofile.stage('bootstrap'):
+                    r_low, r_high = g_this.columnar().bootstrap_diff_ratio(g_base.columnar(),
+                                                                           ns.bootstrap, ns.confidence, ns.seed)
+                for r_bound, name in ((r_low, 'CI low'), (r_high, 'CI high')):
+                    r_bound = NamedTree.Operator.scale_multiply(r_bound, scale = 100, lazy = True)
+                    r_bound.name = name
+                    spec_end[name] = '.2f'
+                    field_suffix[name] = " %"
+                    r_ci_list.append(r_bound)
+            if r_ci_list:
+                r_diff_ratio_note = NamedTree.Operator.user_defined(r_high, cb_func = note_significant, lazy = True)
+            else:
+                r_diff_ratio_note = NamedTree.Operator.user_defined(r_diff_ratio, cb_func = note_over_10_percent, lazy = True)
             r_diff_ratio_note.name = 'ratio_note'
             
             spec_end[r_this.name] = '.0f'
@@ -131,13 +276,312 @@ def main():
             spec_end[r_diff_ratio_note.name] = 's'
             field_suffix[r_diff_ratio_percent.name] = " %"
             r_list.append(r_this)
+            for r_extra in next(e_iter):
+                spec_end[r_extra.name] = '.0f'
+                r_list.append(r_extra)
             r_list.append(r_diff_ratio_percent)
+            r_list.extend(r_ci_list)
             r_list.append(r_diff_ratio_note)
 
-    ngroup = NamedTreeGroup(*r_list)
+    with stageprofile.stage('comparison'):
+        ngroup = NamedTreeGroup(*r_list)
     ngroup.leaf_render.set_field_format_spec_end(**spec_end)
     ngroup.leaf_render.set_field_suffix(**field_suffix)
-    ngroup.leaf_print()
+    with stageprofile.stage('rendering'):
+        ngroup.leaf_print(ns.format)
+
+def print_trend(group_list, ns):
+    ''' The change points of the samples of each directory, in time order
+    as LogDB.samples and RunCatalog.samples return them; the leaf paths
+    start with the name of the directory. '''
+    merged = {}
+    for group in group_list:
+        with stageprofile.stage('trend'):
+            trees = group.columnar().change_points(ns.trend_score)
+        for T in trees:
+            t = T.get_tree()
+            if t:
+                merged.setdefault(T.name, {})[group.name] = t
+    if len(merged) == 0:
+        log.warning('[IOzone] no change point in %s' % ' '.join(map(lambda g:g.name, group_list)))
+        return
+
+    def note_regression (v_list):
+        if v_list[0] < 0:
+            return '***'
+        else:
+            return '   '
+
+    since, before, after, change, score = map(lambda name:NamedTree(name, merged[name]),
+                                               ('since', 'before', 'after', 'change', 'score'))
+    change_percent = NamedTree.Operator.scale_multiply(change, scale = 100, lazy = True)
+    change_percent.name = 'change'
+    change_note = NamedTree.Operator.user_defined(change, cb_func = note_regression, lazy = True)
+    change_note.name = 'ratio_note'
+    with stageprofile.stage('comparison'):
+        ngroup = NamedTreeGroup(since, before, after, change_percent, score, change_note)
+    ngroup.leaf_render.set_field_format_spec_end(since = 's', before = '.0f', after = '.0f',
+                                                 change = '.2f', score = '.2f', ratio_note = 's')
+    ngroup.leaf_render.set_field_suffix(change = ' %')
+    with stageprofile.stage('rendering'):
+        ngroup.leaf_print(ns.format)
+
+def stats_columns(stats_list, extra):
+    ''' The average of each StreamingStats and, if extra, its median and stddev '''
+    average_list = []
+    extra_list = []
+    for stats in stats_list:
+        average = stats.mean()
+        average.name = stats.name
+        average_list.append(average)
+        if extra:
+            median = stats.median()
+            median.name = stats.name + ' median'
+            stddev = stats.stddev()
+            stddev.name = stats.name + ' stddev'
+            extra_list.append([median, stddev])
+        else:
+            extra_list.append([])
+    return average_list, extra_list
+
+def merge_partial(stats_list, filenames):
+    ''' stats_list and the StreamingStats of the files of --export-partial,
+    the ones of the same directory name merged, in the order they come. '''
+    merged = OrderedDict(map(lambda stats:(stats.name, stats), stats_list))
+    for filename in filenames:
+        info, loaded = load_stats(filename)
+        if info.get('test') != 'qa_iozone_4-32G':
+            log.warning('[IOzone] %s is not about qa_iozone_4-32G but %s, ignored' % (filename, info.get('test')))
+            continue
+        for stats in loaded:
+            if stats.name in merged:
+                merged[stats.name].merge(stats)
+            else:
+                merged[stats.name] = stats
+    return list(merged.values())
+
+def select_columns(ns, average_list, extra_list, group_list):
+    ''' Only the leaves matching ns.select, like read/*/4096 or
+    'random write/4194304:16777216' (the file sizes from 4G to 16G
+    excluded) '''
+    if not ns.select:
+        return average_list, extra_list, group_list
+    pattern = parse_path_pattern(ns.select)
+    average_list = list(map(lambda T:T.select(pattern), average_list))
+    extra_list = list(map(lambda extra:list(map(lambda T:T.select(pattern), extra)), extra_list))
+    selected = []
+    for group in group_list:
+        sub = group.select(pattern)
+        sub.name = group.name
+        selected.append(sub)
+    if not any(map(lambda T:T.leaves[0], average_list)):
+        log.warning('[IOzone] no result matches %s' % ns.select)
+    return average_list, extra_list, selected
+
+def watch(ns, cache):
+    ''' Poll the directories every ns.watch seconds, fold the runs finished
+    since the last poll into the StreamingStats of their directory, and
+    print the comparison again. An update costs the parsing of the new
+    runs and a walk over the leaves, whatever the number of runs so far. '''
+    DB_list = list(map(lambda db:ctcs2.LogDB(db, logs = ('qa_iozone_4-32G',)), ns.db))
+    ctcs2.scan_archives(DB_list, ns.jobs)
+    watchers = list(map(lambda DB:ctcs2.RunWatcher(DB, 'qa_iozone_4-32G', 'qa_iozone_4-32G', IOzoneSample),
+                        DB_list))
+    stats_list = list(map(lambda DB:StreamingStats(DB.name), DB_list))
+    while True:
+        new = 0
+        for watcher, stats in zip(watchers, stats_list):
+            with stageprofile.stage('discovery'):
+                db = watcher.poll()
+            with stageprofile.stage('parsing and statistics'):
+                for t in ctcs2.iter_parsed(db, 'parse_mmap', ns.jobs, cache, ns.prefetch):
+                    stats.add(t)
+                    t.set_tree(None)
+            new += len(db)
+        # once every directory has a run
+        if new != 0 and all(map(lambda stats:stats.paths is not None, stats_list)):
+            log.info('[IOzone] %d new runs, %s runs in all' %
+                     (new, ' '.join(map(lambda stats:str(max(stats.count)), stats_list))))
+            average_list, extra_list = stats_columns(stats_list, ns.stats)
+            average_list, extra_list, group_list = select_columns(ns, average_list, extra_list, [])
+            print_comparison(average_list, extra_list, group_list, ns)
+            if ns.format == 'table':
+                print()
+            sys.stdout.flush()
+        time.sleep(ns.watch)
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'Sample Parser', prog = 'Sample')
+    cmdlineparser.add_argument('db', nargs='*', help = 'a directory of runs, or a tar archive of run directories')
+    cmdlineparser.add_argument('--backend', choices = ('dict', 'columnar'),
+                               default = 'columnar',
+                               help = 'storage engine used to aggregate the samples')
+    cmdlineparser.add_argument('-j', '--jobs', type = int, default = 1,
+                               help = 'number of processes parsing the logs, 0 for one per cpu')
+    cmdlineparser.add_argument('--prefetch', type = int, default = 0, metavar = 'THREADS',
+                               help = 'stat and read ahead the logs THREADS at a time, for the logs on a network filesystem')
+    parsecache.add_arguments(cmdlineparser)
+    cmdlineparser.add_argument('--catalog',
+                               help = 'sqlite run catalog, updated incrementally and queried instead of listing the directories')
+    cmdlineparser.add_argument('--since', help = 'only the runs from this date (YYYY-MM-DD[THH:MM:SS]), needs --catalog')
+    cmdlineparser.add_argument('--until', help = 'only the runs until this date, needs --catalog')
+    cmdlineparser.add_argument('--meta-diff', action = 'store_true',
+                               help = 'show the kernel and package changes of the last run of each directory against the first one')
+    cmdlineparser.add_argument('--stats', action = 'store_true',
+                               help = 'fold the samples one at a time and show the median and stddev next to the average')
+    cmdlineparser.add_argument('--compact', action = 'store_true',
+                               help = 'keep the parsed samples in typed arrays to load many runs in less memory')
+    cmdlineparser.add_argument('--format', choices = NamedTreeGroup.LEAF_FORMATS, default = 'table',
+                               help = 'table for reading, csv or json (one object per line) for other tools')
+    cmdlineparser.add_argument('--bootstrap', type = int, default = 0, metavar = 'N',
+                               help = 'flag only the regressions whose bootstrap confidence interval of N resamples is below 0, if every directory has 5 samples or more')
+    cmdlineparser.add_argument('--confidence', type = float, default = 0.95,
+                               help = 'confidence level of the bootstrap interval')
+    cmdlineparser.add_argument('--seed', type = int, help = 'seed of the bootstrap resampling')
+    cmdlineparser.add_argument('--baseline', metavar = 'NAME',
+                               help = 'the directory the others are compared with, by its name; the first one by default')
+    cmdlineparser.add_argument('--matrix', action = 'store_true',
+                               help = 'compare every pair of directories (or each one against --baseline) in one table, instead of leaf by leaf')
+    cmdlineparser.add_argument('--trend', action = 'store_true',
+                               help = 'find in the runs of each directory, in time order, the one where each result changed by more than 10%%')
+    cmdlineparser.add_argument('--trend-score', type = float, default = 1.36,
+                               help = 'the CUSUM score of a change point, 1.36 is a false alarm for 5%% of the unchanged results')
+    cmdlineparser.add_argument('--export-partial', metavar = 'FILE',
+                               help = 'write the statistics of each directory to FILE instead of comparing them, to be merged by --partial elsewhere')
+    cmdlineparser.add_argument('--partial', action = 'append', metavar = 'FILE',
+                               help = 'merge the statistics written by --export-partial into the ones of the directories with the same name, may be repeated')
+    cmdlineparser.add_argument('--watch', type = float, metavar = 'SECONDS',
+                               help = 'keep running, poll for the finished runs every SECONDS and print the comparison again when there are new ones')
+    cmdlineparser.add_argument('--select', metavar = 'PATTERN',
+                               help = 'only the results matching PATTERN, like read/*/4096: a name, a size, * for all, START:STOP for the sizes from START to STOP excluded, or A,B')
+    stageprofile.add_arguments(cmdlineparser)
+
+    # perfstat.py is the command line for all the tests
+
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+    cache = parsecache.from_arguments(ns)
+    stageprofile.from_arguments(ns)
+    if len(ns.db) < 0:
+        print('Usages')
+        exit()
+    if ns.bootstrap and ns.stats:
+        cmdlineparser.error('--bootstrap needs every sample, it does not work with --stats')
+    if ns.bootstrap and numpy is None:
+        cmdlineparser.error('--bootstrap needs numpy')
+    if ns.matrix and numpy is None:
+        cmdlineparser.error('--matrix needs numpy')
+    if ns.matrix and (ns.bootstrap or ns.stats):
+        cmdlineparser.error('--matrix only compares the averages, it does not work with --bootstrap or --stats')
+    if len(ns.db) == 0 and not ns.partial:
+        cmdlineparser.error('a directory or --partial is needed')
+    # the statistics of the samples are kept instead of the samples
+    fold = ns.stats or ns.partial or ns.export_partial
+    if fold and (ns.trend or ns.bootstrap):
+        cmdlineparser.error('--trend and --bootstrap need every run, they do not work with --stats, --partial or --export-partial')
+    if ns.partial and ns.meta_diff:
+        cmdlineparser.error('--partial has no run metadata, it does not work with --meta-diff')
+    if ns.trend and numpy is None:
+        cmdlineparser.error('--trend needs numpy')
+    if ns.trend and (ns.stats or ns.matrix or ns.bootstrap):
+        cmdlineparser.error('--trend looks at every run, it does not work with --stats, --matrix or --bootstrap')
+    if ns.watch is not None and (ns.partial or ns.export_partial or ns.trend or ns.bootstrap or ns.catalog or ns.meta_diff or ns.matrix or ns.baseline):
+        cmdlineparser.error('--watch only keeps the statistics of the runs, it does not work with --partial, --export-partial, --trend, --bootstrap, --catalog, --meta-diff, --matrix or --baseline')
+    if (ns.since or ns.until) and not ns.catalog:
+        cmdlineparser.error('--since and --until need --catalog')
+    archives = list(filter(lambda db:ctcs2.archive_suffix(db) and os.path.isfile(db), ns.db))
+    if ns.catalog and archives:
+        cmdlineparser.error('--catalog only records directories, not the archives %s' % ' '.join(archives))
+
+    if ns.watch is not None:
+        try:
+            watch(ns, cache)
+        except KeyboardInterrupt:
+            pass
+        stageprofile.finish(ns)
+        return
+
+    average_list = []
+    # the columns shown after the average of each directory
+    extra_list = []
+    meta_list = []
+    # the groups of samples to be resampled by --bootstrap
+    group_list = []
+    stats_list = []
+    catalog = ctcs2.RunCatalog(ns.catalog) if ns.catalog else None
+    # the archives are read at once
+    DB_list = list(map(lambda db:ctcs2.LogDB(db, ('kernel', 'rpmlist') if ns.meta_diff else (), ('qa_iozone_4-32G',)), ns.db))
+    if not catalog:
+        with stageprofile.stage('discovery'):
+            ctcs2.scan_archives(DB_list, ns.jobs)
+
+    for DB in DB_list:
+        with stageprofile.stage('discovery'):
+            if catalog:
+                catalog.update(DB.log_dir)
+                db = catalog.samples('qa_iozone_4-32G', IOzoneSample, test = 'qa_iozone_4-32G',
+                                     dir = DB.log_dir, since = ns.since, until = ns.until)
+            else:
+                db = DB.samples('qa_iozone_4-32G', 'qa_iozone_4-32G', IOzoneSample)
+        if len(db) == 0:
+            log.warning('[IOzone] There is no log files from %s' % DB.log_dir)
+            continue
+        if fold:
+            # only one parsed tree at a time is kept
+            stats = StreamingStats(DB.name)
+            with stageprofile.stage('parsing and statistics'):
+                for t in ctcs2.iter_parsed(db, 'parse_mmap', ns.jobs, cache, ns.prefetch):
+                    stats.add(t)
+                    t.set_tree(None)
+            stats_list.append(stats)
+            meta_list.append(db[-1].meta)
+            continue
+        with stageprofile.stage('parsing'):
+            ctcs2.parse_samples(db, 'parse_mmap', ns.jobs, cache, ns.compact, ns.prefetch)
+        with stageprofile.stage('aggregation'):
+            group = NamedTreeGroup(*db, backend = ns.backend)
+            average = group.average()
+        group.name = DB.name
+        extra_list.append([])
+        group_list.append(group)
+        average.name = DB.name
+        average_list.append(average)
+        meta_list.append(db[-1].meta)
+
+    if ns.partial:
+        with stageprofile.stage('merge'):
+            stats_list = merge_partial(stats_list, ns.partial)
+    if ns.export_partial:
+        save_stats(ns.export_partial, stats_list, test = 'qa_iozone_4-32G')
+        stageprofile.finish(ns)
+        return
+    if fold:
+        average_list, extra_list = stats_columns(stats_list, ns.stats)
+
+    if ns.baseline:
+        names = list(map(lambda T:T.name, average_list))
+        if ns.baseline not in names:
+            cmdlineparser.error('--baseline %s is none of %s' % (ns.baseline, ' '.join(names)))
+        i = names.index(ns.baseline)
+        for l in (average_list, extra_list, group_list, meta_list):
+            if len(l) > i:
+                l.insert(0, l.pop(i))
+
+    if ns.meta_diff:
+        print_meta_diff(average_list, meta_list)
+    with stageprofile.stage('selection'):
+        average_list, extra_list, group_list = select_columns(ns, average_list, extra_list, group_list)
+
+    if ns.trend:
+        print_trend(group_list, ns)
+    elif ns.matrix:
+        with stageprofile.stage('comparison'):
+            ngroup = NamedTreeGroup(*average_list, backend = 'columnar')
+        with stageprofile.stage('rendering'):
+            # only the row of the baseline, if there is one
+            ngroup.matrix_print(ns.format, base = ns.baseline)
+    else:
+        print_comparison(average_list, extra_list, group_list, ns)
+    stageprofile.finish(ns)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import sys
+import logging
+import argparse
+from namedtree import NamedTree, NamedTreeGroup
+import ctcs2
+import parsecache
+import stageprofile
+
+log = logging.getLogger()
+
+SECTIONS = ('Sequential Reads', 'Random Reads', 'Sequential Writes', 'Random Writes')
+# the columns after kernel, file size, blk size and threads
+METRICS = ('Rate', 'CPU%', 'Avg Lat', 'Max Lat', 'Lat% >2s', 'Lat% >10s', 'CPU Eff')
+# a regression of these is an increase
+LOWER_IS_BETTER = ('CPU%', 'Avg Lat', 'Max Lat', 'Lat% >2s', 'Lat% >10s')
+# tiobench prints it when a value does not fit in its column
+OVERFLOW = '#####'
+# and this when a percentage is too small to be measured
+TOO_SMALL = '1e-10%'
+
+class TiobenchSample(NamedTree):
+    # to be increased when the tree parsed from a log changes
+    PARSE_VERSION = 2
+    __slots__ = ctcs2.SAMPLE_SLOTS
+
+    def __init__(self, filename, name = None):
+        self.filename = filename
+        if not name:
+            super().__init__(filename)
+        else:
+            super().__init__(name)
+
+        self.tree = {}
+        self.fd = None
+
+    def record(self, section, fields):
+        ''' fields: kernel, file size, blk size, threads, then METRICS '''
+        stageprofile.count('lines matched')
+        fsize = int(fields[1])
+        blksize = int(fields[2])
+        threads = int(fields[3])
+        blk_tree = self.tree[section].setdefault(fsize, {}).setdefault(blksize, {})
+        if threads in blk_tree:
+            log.warning('[TiobenchSample] duplicate result %s %s %s %s' % (section, fsize, blksize, threads))
+            return
+        result_tree = {}
+        for m, v in zip(METRICS, fields[4:]):
+            if v == OVERFLOW:
+                continue
+            if v == TOO_SMALL:
+                result_tree[m] = 0.0
+                continue
+            # CPU% is like 23.12%
+            result_tree[m] = float(v.rstrip('%'))
+        blk_tree[threads] = result_tree
+
+    def parse(self):
+        ''' One pass: a line naming a section starts it, and the rows of
+        2 + 2 + len(METRICS) fields are the results of the current section.'''
+        for s in SECTIONS:
+            self.tree[s] = {}
+        self.fd = ctcs2.open_log(self)
+        section = None
+        for line in self.fd:
+            stageprofile.count('lines scanned')
+            name = line.strip()
+            if name in SECTIONS:
+                section = name
+                continue
+            if section is None:
+                continue
+            fields = name.split()
+            if len(fields) != 4 + len(METRICS) or not fields[1].isdigit():
+                section = None
+                continue
+            try:
+                self.record(section, fields)
+            except ValueError:
+                log.warning('[TiobenchSample] unexpected result %s' % name)
+        self.fd.close()
+
+def main():
+    cmdlineparser = argparse.ArgumentParser(description = 'TiobenchSample Parser', prog = 'TiobenchSample')
+    cmdlineparser.add_argument('db', nargs='+', help = 'a directory of runs, or a tar archive of run directories')
+    cmdlineparser.add_argument('--backend', choices = ('dict', 'columnar'),
+                               default = 'columnar',
+                               help = 'storage engine used to aggregate the samples')
+    cmdlineparser.add_argument('-j', '--jobs', type = int, default = 1,
+                               help = 'number of processes parsing the logs, 0 for one per cpu')
+    cmdlineparser.add_argument('--prefetch', type = int, default = 0, metavar = 'THREADS',
+                               help = 'stat and read ahead the logs THREADS at a time, for the logs on a network filesystem')
+    parsecache.add_arguments(cmdlineparser)
+    stageprofile.add_arguments(cmdlineparser)
+    cmdlineparser.add_argument('--format', choices = NamedTreeGroup.LEAF_FORMATS, default = 'table',
+                               help = 'table for reading, csv or json (one object per line) for other tools')
+
+    ns = cmdlineparser.parse_args(sys.argv[1:])
+    cache = parsecache.from_arguments(ns)
+    stageprofile.from_arguments(ns)
+
+    average_list = []
+
+    DB_list = list(map(lambda db:ctcs2.LogDB(db, logs = ('tiobench',)), ns.db))
+    with stageprofile.stage('discovery'):
+        ctcs2.scan_archives(DB_list, ns.jobs)
+    for DB in DB_list:
+        with stageprofile.stage('discovery'):
+            db = DB.samples('tiobench-bench', 'tiobench', TiobenchSample)
+        if len(db) == 0:
+            log.warning('[Tiobench] There is no log files from %s' % DB.log_dir)
+            continue
+        with stageprofile.stage('parsing'):
+            ctcs2.parse_samples(db, 'parse', ns.jobs, cache, prefetch = ns.prefetch)
+        with stageprofile.stage('aggregation'):
+            group = NamedTreeGroup(*db, backend = ns.backend)
+            average = group.average()
+        average.name = DB.name
+        average_list.append(average)
+
+    if len(average_list) == 0:
+        return
+
+    a_iter = iter(average_list)
+    r_base = next(a_iter)
+    r_list = list()
+    r_list.append(r_base)
+    spec_end = {r_base.name:'.2f'}
+    field_suffix = {}
+    for r_this in a_iter:
+        # the Lat% are often 0
+        r_diff_ratio = NamedTree.Operator.safe_diff_ratio(r_base, r_this)
+        r_diff_ratio_percent = NamedTree.Operator.scale_multiply(r_diff_ratio, scale = 100)
+        r_diff_ratio_percent.name = 'Fluctuation'
+        r_diff_ratio_note = NamedTree.Operator.regression_note(r_diff_ratio, lower_is_better = lambda path, k:k in LOWER_IS_BETTER)
+        r_diff_ratio_note.name = 'ratio_note'
+
+        spec_end[r_this.name] = '.2f'
+        spec_end[r_diff_ratio_percent.name] = '.2f'
+        spec_end[r_diff_ratio_note.name] = 's'
+        field_suffix[r_diff_ratio_percent.name] = " %"
+        r_list.append(r_this)
+        r_list.append(r_diff_ratio_percent)
+        r_list.append(r_diff_ratio_note)
+
+    with stageprofile.stage('comparison'):
+        ngroup = NamedTreeGroup(*r_list)
+    ngroup.leaf_render.set_field_format_spec_end(**spec_end)
+    ngroup.leaf_render.set_field_suffix(**field_suffix)
+    with stageprofile.stage('rendering'):
+        ngroup.leaf_print(ns.format)
+    stageprofile.finish(ns)
+
+if __name__ == '__main__':
+    main()
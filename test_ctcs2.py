@@ -0,0 +1,65 @@
+''' python3 -m unittest test_ctcs2 '''
+import os
+import shutil
+import tempfile
+import unittest
+from benchmark import synth
+from statIOzone import IOzoneSample
+import ctcs2
+import parsecache
+
+class CountingCache(parsecache.ParseCache):
+    ''' counts the trees loaded from the cache '''
+    loaded = 0
+
+    def get(self, t, parse):
+        tree = super().get(t, parse)
+        if tree is not None:
+            self.loaded += 1
+        return tree
+
+class TestIterParsed(unittest.TestCase):
+    RUNS = 12
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.product = synth.generate(os.path.join(self.root, 'runs'), 'iozone', 1, self.RUNS, 2)[0]
+        self.cache = CountingCache(os.path.join(self.root, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def samples(self):
+        return ctcs2.LogDB(self.product).samples('qa_iozone_4-32G', 'qa_iozone_4-32G', IOzoneSample)
+
+    def check_fold(self, jobs, prefetch, ahead):
+        expected = list(map(lambda t:t.get_tree(), ctcs2.parse_samples(self.samples(), 'parse_mmap', cache = self.cache)))
+        self.cache.loaded = 0
+        db = self.samples()
+        trees = []
+        for i, t in enumerate(ctcs2.iter_parsed(db, 'parse_mmap', jobs, self.cache, prefetch)):
+            # the trees loaded and not yielded yet
+            self.assertLessEqual(self.cache.loaded - i, ahead)
+            self.assertLessEqual(sum(map(lambda s:bool(s.tree), db)), 1)
+            trees.append(t.get_tree())
+            t.set_tree(None)
+        self.assertEqual(self.cache.loaded, self.RUNS)
+        self.assertEqual(trees, expected)
+
+    def test_cached_fold(self):
+        self.check_fold(1, 0, 1)
+
+    def test_cached_fold_jobs(self):
+        self.check_fold(2, 0, 8)
+
+    def test_cached_fold_prefetch(self):
+        self.check_fold(1, 2, 8)
+
+    def test_parsed_in_order(self):
+        trees = list(map(lambda t:t.get_tree(), ctcs2.parse_samples(self.samples(), 'parse_mmap')))
+        for jobs, prefetch in ((2, 0), (1, 2)):
+            db = ctcs2.parse_samples(self.samples(), 'parse_mmap', jobs, prefetch = prefetch)
+            self.assertEqual(list(map(lambda t:t.get_tree(), db)), trees)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+''' python3 -m unittest test_namedtree '''
+import io
+import json
+import unittest
+from namedtree import NamedTree, NamedTreeGroup, ColumnarGroup, StreamingStats, ANY, _spec_cache, _plan_cache
+
+class TestSpecCache(unittest.TestCase):
+    def setUp(self):
+        _spec_cache.clear()
+        _plan_cache.clear()
+
+    def test_shape_reused_across_groups(self):
+        A = NamedTree('A', {'a': {'x': 1}, 'e': {'y': 2}})
+        B = NamedTree('B', {'a': {'x': 3}})
+        NamedTreeGroup(A, B)
+        # the spec of the group of A and B is not the one of A alone
+        A.compact()
+        self.assertEqual(A.get_tree(), {'a': {'x': 1}, 'e': {'y': 2}})
+        C = NamedTree('C', {'a': {'x': 5}, 'e': {'y': 6}})
+        C.compact()
+        self.assertEqual(C.get_tree(), {'a': {'x': 5}, 'e': {'y': 6}})
+        self.assertEqual(NamedTreeGroup(A, C).average().get_tree(), {'a': {'x': 3}, 'e': {'y': 4}})
+
+class TestPlan(unittest.TestCase):
+    def setUp(self):
+        _spec_cache.clear()
+        _plan_cache.clear()
+
+    def test_warning_names_the_tree(self):
+        A = NamedTree('A', {'a': 1, 'b': 2})
+        B = NamedTree('B', {'a': 3, 'b': 4})
+        C = NamedTree('C', {'a': 5})
+        with self.assertLogs(level = 'WARNING') as logs:
+            NamedTreeGroup(A, B, C).average()
+        plan = list(filter(lambda l:'[Plan]' in l, logs.output))
+        self.assertEqual(len(plan), 1)
+        self.assertIn('C has no value at /b', plan[0])
+
+class TestMatrix(unittest.TestCase):
+    def test_lower_is_better(self):
+        A = NamedTree('A', {'r': {'kB/s': 100, '%CPU': 10}})
+        B = NamedTree('B', {'r': {'kB/s': 100, '%CPU': 20}})
+        group = NamedTreeGroup(A, B, backend = 'columnar')
+        geomean, regressed, improved = group.diff_ratio_summary()
+        self.assertEqual((regressed[0, 1], improved[0, 1]), (0, 1))
+        geomean, regressed, improved = group.diff_ratio_summary(lower_is_better = lambda path, k:k == '%CPU')
+        self.assertEqual((regressed[0, 1], improved[0, 1]), (1, 0))
+        self.assertEqual((regressed[1, 0], improved[1, 0]), (0, 1))
+        self.assertAlmostEqual(geomean[0, 1], 0.5 ** 0.5 - 1)
+
+class TestLeafPrint(unittest.TestCase):
+    def group(self):
+        A = NamedTree('A', {'x': {'p': 1, 'q': 2}, 'y': 4})
+        B = NamedTree('A', {'x': {'p': 2, 'q': 3}, 'y': 5})
+        B.compact()
+        ratio = NamedTree.Operator.diff_ratio(A, B, lazy = True)
+        percent = NamedTree.Operator.scale_multiply(ratio, scale = 100, lazy = True)
+        return NamedTreeGroup(A, B, percent), percent
+
+    def test_rows_leave_the_results_pending(self):
+        group, percent = self.group()
+        out = io.StringIO()
+        group.leaf_print('csv', out)
+        self.assertTrue(percent.pending())
+        self.assertEqual(out.getvalue().splitlines(),
+                         ['path,A,A 2,%s' % percent.name, 'x/p,1,2,100.0', 'x/q,2,3,50.0', 'y,4,5,25.0'])
+        group.leaf_print('json', out)
+        self.assertTrue(percent.pending())
+
+    def test_table_fields(self):
+        group, percent = self.group()
+        group.leaf_render.set_field_format_spec_end(**{'A': '.1f', 'A 2': '.2f', percent.name: '.0f'})
+        out = io.StringIO()
+        group.leaf_print('table', out)
+        self.assertEqual(out.getvalue().splitlines()[1].split(), ['x/p', '1.0', '2.00', '100'])
+
+class TestStreamingStats(unittest.TestCase):
+    def trees(self, n):
+        return list(map(lambda i:NamedTree('T%d' % i, {'x': {'p': i * 3 % 7, 'q': i * 0.5}, 'y': 10 - i}), range(n)))
+
+    def leaves(self, stats):
+        return list(map(lambda T:T.get_tree(), (stats.get_count(), stats.mean(), stats.variance(),
+                                                stats.min(), stats.max(), stats.median())))
+
+    def check_same(self, stats, expected):
+        for tree, other in zip(self.leaves(stats), self.leaves(expected)):
+            for k in ('p', 'q'):
+                self.assertAlmostEqual(tree['x'][k], other['x'][k])
+            self.assertAlmostEqual(tree['y'], other['y'])
+
+    def test_merge(self):
+        trees = self.trees(11)
+        expected = StreamingStats('all')
+        for T in trees:
+            expected.add(T)
+        a = StreamingStats('all')
+        b = StreamingStats('all')
+        for T in trees[:4]:
+            a.add(T)
+        for T in trees[4:]:
+            b.add(T)
+        self.check_same(a.merge(b), expected)
+        self.assertEqual(expected.min().get_tree()['x']['p'], 0)
+        self.assertEqual(expected.get_count().get_tree()['y'], 11)
+
+    def test_merge_saved_state(self):
+        trees = self.trees(9)
+        expected = StreamingStats('all')
+        for T in trees:
+            expected.add(T)
+        parts = []
+        for s in range(0, 9, 3):
+            part = StreamingStats('all')
+            for T in trees[s:s + 3]:
+                part.add(T)
+            parts.append(StreamingStats.from_state(json.loads(json.dumps(part.state()))))
+        merged = StreamingStats('all')
+        for part in parts:
+            merged.merge(part)
+        self.check_same(merged, expected)
+
+    def test_merge_empty(self):
+        stats = StreamingStats('all')
+        stats.merge(StreamingStats('none'))
+        self.assertEqual(stats.mean().get_tree(), {})
+        for T in self.trees(2):
+            stats.add(T)
+        self.assertEqual(stats.mean().get_tree()['y'], 9.5)
+
+class TestBootstrap(unittest.TestCase):
+    def group(self, factor, n):
+        return NamedTreeGroup(*map(lambda i:NamedTree('T%d' % i, {'a': (100 + i) * factor, 'b': 50 + i % 3}),
+                                   range(n)), backend = 'columnar').columnar()
+
+    def test_interval(self):
+        base = self.group(1, 8)
+        this = self.group(1.2, 8)
+        low, high = this.bootstrap_diff_ratio(base, 2000, 0.95, seed = 1)
+        low, high = low.get_tree(), high.get_tree()
+        self.assertLess(low['a'], 0.2)
+        self.assertGreater(high['a'], 0.2)
+        self.assertGreater(low['a'], 0.1)
+        self.assertLessEqual(low['b'], 0)
+        self.assertGreaterEqual(high['b'], 0)
+        again = this.bootstrap_diff_ratio(base, 2000, 0.95, seed = 1)
+        self.assertEqual((again[0].get_tree(), again[1].get_tree()), (low, high))
+
+    def test_too_few_samples(self):
+        n = ColumnarGroup.BOOTSTRAP_MIN_SAMPLES
+        with self.assertRaises(ValueError):
+            self.group(1.2, n - 1).bootstrap_diff_ratio(self.group(1, n + 1), 100)
+
+class TestChangePoints(unittest.TestCase):
+    NOISE = (1, -1, 2, -2, 0, 1, -1, 0, 2, -2, 1, -1)
+
+    def runs(self, since):
+        # a drops by 20% at the run since, c by 5%, b does not move
+        return list(map(lambda i, e:NamedTree('R%d' % i, {'a': (100 if i < since else 80) + e,
+                                                          'b': 50 + e,
+                                                          'c': (200 if i < since else 190) + e}),
+                        range(len(self.NOISE)), self.NOISE))
+
+    def test_shifted_series(self):
+        for since in (3, 7, 9):
+            with self.subTest(since = since):
+                group = NamedTreeGroup(*self.runs(since), backend = 'columnar')
+                before, after, change, score, since_T = group.columnar().change_points()
+                self.assertEqual(since_T.get_tree(), {'a': 'R%d' % since})
+                self.assertAlmostEqual(before.get_tree()['a'], 100, delta = 1)
+                self.assertAlmostEqual(after.get_tree()['a'], 80, delta = 1)
+                self.assertAlmostEqual(change.get_tree()['a'], -0.2, delta = 0.02)
+                self.assertGreater(score.get_tree()['a'], 1.36)
+
+    def test_too_few_runs(self):
+        group = NamedTreeGroup(*self.runs(1)[:2], backend = 'columnar')
+        self.assertEqual(list(map(lambda T:T.get_tree(), group.columnar().change_points())), [{}] * 5)
+
+class TestSelect(unittest.TestCase):
+    TREE = {'x': {'p': 1, 'q': 2}, 'y': 3, 'z': {'p': 4}}
+
+    def check(self, pattern, expected):
+        T = NamedTree('T', self.TREE)
+        by_dict = T.select(pattern).leaves
+        index = T.path_index()
+        by_index = index.paths_in(index.select(pattern))
+        T.compact()
+        by_compact = T.select(pattern).leaves
+        self.assertEqual(list(by_dict[0]), expected)
+        self.assertEqual(list(by_index), expected)
+        self.assertEqual(list(by_compact[0]), expected)
+        self.assertEqual(list(by_dict[1]), list(by_compact[1]))
+
+    def test_leaf_above_the_pattern(self):
+        self.check((ANY, 'p'), [('x', 'p'), ('z', 'p')])
+
+    def test_prefix(self):
+        self.check(('x',), [('x', 'p'), ('x', 'q')])
+        self.check(('y',), [('y',)])
+
+if __name__ == '__main__':
+    unittest.main()
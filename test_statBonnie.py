@@ -0,0 +1,34 @@
+''' python3 -m unittest test_statBonnie '''
+import glob
+import os
+import unittest
+from benchmark.bonnie_parse import DomBonnieSample
+from statBonnie import BonnieSample
+
+LOGS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'samples', 'bonnie-directIO-*', 'bonnie-directIO')))
+
+class TokenizerOnly(BonnieSample):
+    ''' fails on a row the tokenizer leaves to the DOM '''
+    __slots__ = ()
+
+    def _pas_TR_dom(self, line):
+        raise AssertionError('not tokenized: %s' % line)
+
+def parsed(cls, filename):
+    t = cls(filename)
+    t.parse()
+    t.fd.close()
+    return t.get_tree()
+
+class TestTokenizer(unittest.TestCase):
+    def test_same_tree_as_dom(self):
+        self.assertTrue(LOGS)
+        for filename in LOGS:
+            with self.subTest(filename = filename):
+                tree = parsed(TokenizerOnly, filename)
+                self.assertTrue(tree['putc'])
+                self.assertEqual(tree, parsed(DomBonnieSample, filename))
+
+if __name__ == '__main__':
+    unittest.main()
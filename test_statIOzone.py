@@ -0,0 +1,110 @@
+''' python3 -m unittest test_statIOzone '''
+import csv
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from benchmark import synth
+from statIOzone import IOzoneSample
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+LOGS = sorted(glob.glob(os.path.join(HERE, 'iozone', '*', '*', 'qa_iozone_4-32G')))
+
+# a second header and block after the end of the first one: a new file
+# size, a duplicate of a record of the first block and a short record
+MORE = '''some text
+              KB  reclen   write
+      67108864    4096  1 2 3 4 5 6 7 8 9 10 11 12 13
+       4194304    4096  9 9 9 9 9 9 9 9 9 9 9 9 9
+      67108864    8192  1 2 3
+'''
+
+def parsed(filename, parse, content = None):
+    t = IOzoneSample(filename)
+    t.content = content
+    getattr(t, parse)()
+    return t.get_tree()
+
+class TestParseMmap(unittest.TestCase):
+    def check(self, filename):
+        tree = parsed(filename, 'parse_default')
+        self.assertTrue(tree['write'])
+        self.assertEqual(parsed(filename, 'parse_mmap'), tree)
+        with open(filename, 'rb') as f:
+            self.assertEqual(parsed(filename, 'parse_mmap', f.read()), tree)
+        return tree
+
+    def test_sample_logs(self):
+        self.assertTrue(LOGS)
+        for filename in LOGS:
+            with self.subTest(filename = filename):
+                self.check(filename)
+
+    def test_records_after_the_block(self):
+        with open(LOGS[0]) as f:
+            text = f.read()
+        with tempfile.NamedTemporaryFile('w', suffix = '.log') as f:
+            f.write(text + MORE)
+            f.flush()
+            with self.assertLogs(level = 'WARNING'):
+                tree = self.check(f.name)
+        self.assertEqual(tree['write'][67108864], {4096: 1, 8192: 1})
+        self.assertEqual(tree['read'][67108864], {4096: 3, 8192: 3})
+        self.assertNotIn(8192, tree['reread'][67108864])
+        self.assertEqual(tree['write'][4194304][4096], parsed(LOGS[0], 'parse_default')['write'][4194304][4096])
+
+class TestPartial(unittest.TestCase):
+    RUNS = 8
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.products = synth.generate(os.path.join(self.root, 'all'), 'iozone', 2, self.RUNS, 2)
+        # the runs of each product split over two places, under the same name
+        self.parts = []
+        for part, runs in (('a', slice(0, 3)), ('b', slice(3, None))):
+            dirs = []
+            for product in self.products:
+                dirname = os.path.join(self.root, part, os.path.basename(product))
+                for run in sorted(os.listdir(product))[runs]:
+                    shutil.copytree(os.path.join(product, run), os.path.join(dirname, run))
+                dirs.append(dirname)
+            self.parts.append(dirs)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_stat(self, *args):
+        env = dict(os.environ, HOME = self.root)
+        out = subprocess.run([sys.executable, os.path.join(HERE, 'statIOzone.py'), '--no-cache'] + list(args),
+                             stdout = subprocess.PIPE, env = env, check = True, universal_newlines = True).stdout
+        return list(csv.reader(out.splitlines()))
+
+    def assertSameRows(self, rows, expected):
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(rows[0], expected[0])
+        for row, other in zip(rows[1:], expected[1:]):
+            self.assertEqual(row[0], other[0])
+            for v, e in zip(row[1:], other[1:]):
+                if e in ('', '***', '   '):
+                    self.assertEqual(v, e)
+                else:
+                    # the means are merged in another order
+                    self.assertAlmostEqual(float(v), float(e), delta = abs(float(e)) * 1e-9)
+
+    def test_export_and_merge(self):
+        expected = self.run_stat('--stats', '--format', 'csv', *self.products)
+        self.assertGreater(len(expected), 1)
+        a = os.path.join(self.root, 'a.json.gz')
+        b = os.path.join(self.root, 'b.json.gz')
+        self.run_stat('--export-partial', a, *self.parts[0])
+        self.run_stat('--export-partial', b, *self.parts[1])
+        self.assertSameRows(self.run_stat('--stats', '--format', 'csv', '--partial', a, '--partial', b), expected)
+        # or merged into the directories parsed here
+        self.assertSameRows(self.run_stat('--stats', '--format', 'csv', '--partial', a, *self.parts[1]), expected)
+
+if __name__ == '__main__':
+    unittest.main()